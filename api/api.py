@@ -3,17 +3,29 @@
 API providing access to the database that stores course data
 """
 
+import asyncio
+import base64
+import binascii
+import contextvars
+import hashlib
 import os
-import re
+import time
 from typing import Annotated
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, Path, Query
+from fastapi import Body, FastAPI, HTTPException, Path, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from mangum import Mangum
-import motor.motor_asyncio
 
 import utils
+from cache import ResponseCache
+from compression import CompressionMiddleware
+from metrics import Metrics, TimingMiddleware, timed
+from normalizer import normalize_query, query_variations
+from search_backends import AtlasSearchBackend, LocalSearchBackend, SearchBackend, course_id_range, projection
+from search_engine import CourseSearchEngine
+from serialization import CourseJSONResponse, dumps
 
 load_dotenv()
 
@@ -24,134 +36,397 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-uri = os.getenv("MONGODB_URI")
-client = motor.motor_asyncio.AsyncIOMotorClient(uri)
-db = client["db"]
+# Responses are compressed with the first accepted of COMPRESSION_ENCODINGS (set to "" to disable, e.g. behind a CDN)
+compression_encodings = [encoding.strip() for encoding in os.getenv("COMPRESSION_ENCODINGS", "br,gzip").split(",") if encoding.strip()]
+if compression_encodings:
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=compression_encodings,
+        minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024")),
+        stream_flush_size=int(os.getenv("COMPRESSION_STREAM_FLUSH_SIZE", "16384"))
+    )
 
-synonymous_department_codes = utils.load_synonyms("synonymous_department_codes")
+# Per-stage request timings, reported in Server-Timing headers, at /metrics, and (if REQUEST_LOG=1) as JSON log lines
+# Latencies are labeled by university only for universities listed in UNIVERSITIES_FILE (a copy of universities.json
+# bundled with the API) if given, and otherwise for the first MAX_UNIVERSITY_LABELS universities requested
+UNIVERSITIES_FILE = os.getenv("UNIVERSITIES_FILE")
+metrics = Metrics(
+    known_university_ids=utils.load_university_ids(UNIVERSITIES_FILE) if UNIVERSITIES_FILE else None,
+    max_university_labels=int(os.getenv("MAX_UNIVERSITY_LABELS", "64"))
+)
+app.add_middleware(TimingMiddleware, metrics=metrics, log_requests=os.getenv("REQUEST_LOG", "0") == "1")
+
+# Synonyms are loaded from a bundled snapshot file if one is given, and otherwise lazily on first request,
+# so that importing this module (i.e. Lambda cold start) does not block on the database
+SYNONYMS_SNAPSHOT = os.getenv("SYNONYMS_SNAPSHOT")
+synonymous_department_codes = None
+if SYNONYMS_SNAPSHOT:
+    synonymous_department_codes = utils.load_synonyms_snapshot(SYNONYMS_SNAPSHOT)
+
+
+async def get_synonymous_department_codes() -> dict:
+    """Get the department code synonyms map, loading it from the database on first call"""
+    global synonymous_department_codes
+    if synonymous_department_codes is None:
+        with timed("synonyms"):
+            synonymous_department_codes = await utils.load_synonyms("synonymous_department_codes")
+    return synonymous_department_codes
+
+# Courses are searched with the "local" backend (in-process search engine over a snapshot of the courses collection),
+# falling back to the "atlas" backend (Atlas Search), unless SEARCH_BACKEND is "atlas"
+# The snapshot is loaded in the background, and requests are served by the Atlas backend until it is loaded
+search_engine = CourseSearchEngine()
+search_engine_enabled = os.getenv("SEARCH_BACKEND", "local") == "local"
+search_engine_load_task = None
+local_backend = LocalSearchBackend(search_engine)
+atlas_backend = AtlasSearchBackend(utils.get_database)
+
+
+def start_loading_search_engine():
+    """Start loading a snapshot of the courses collection into the search engine in the background, unless it is loaded or loading
+
+    Called on the first request and then on every version check, so that a failed load is retried at most once per
+    VERSION_CHECK_INTERVAL_SEC
+    """
+    global search_engine_load_task
+    if not search_engine_enabled or search_engine.loaded:
+        return
+    if search_engine_load_task is not None and not search_engine_load_task.done():
+        return
+    # Run in a fresh context, so that the load is not timed as a stage of the request that started it
+    search_engine_load_task = asyncio.create_task(load_search_engine(), context=contextvars.Context())
+
+
+async def load_search_engine():
+    """Load a snapshot of the courses collection into the search engine
+
+    If the snapshot cannot be loaded, requests keep being served by Atlas Search until a later load succeeds
+    """
+    start_time = time.perf_counter()
+    version = data_version
+    try:
+        documents = await utils.get_database()["courses"].find().sort("_id", 1).to_list()
+    except Exception as e:
+        print(f"Failed to load search engine snapshot, serving requests with Atlas Search: {e}")
+        return
+    if version != data_version:
+        return  # Data changed while loading, so the snapshot may be stale and is loaded again
+    search_engine.load(documents)
+    print(f"Loaded search engine snapshot of {len(documents)} courses in {time.perf_counter() - start_time:.2f} seconds")
+
+
+def get_search_backend(university_id: str) -> SearchBackend:
+    """Get the local backend if its snapshot is loaded and has the university indexed, and the Atlas backend otherwise"""
+    if search_engine_load_task is None:
+        start_loading_search_engine()
+    if search_engine.loaded and local_backend.has_university(university_id):
+        return local_backend
+    return atlas_backend
+
+# Listings of all courses of a university are paginated (with pages of at most MAX_PAGE_SIZE courses, so that the
+# memory of a response does not grow with the size of a catalog), or streamed in batches
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+MAX_BATCH_LOOKUP_SIZE = int(os.getenv("MAX_BATCH_LOOKUP_SIZE", "1000"))
+# Numbers of a batch lookup without an exact match are searched at most BATCH_SEARCH_CONCURRENCY at a time, since each
+# search may run one Atlas Search aggregation per query variation
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "8"))
+
+# Fields returned with fields=summary, enough for a list of search results
+SUMMARY_FIELDS = ("number", "title")
+
+# Response cache, invalidated whenever db/writer.py bumps the data version stamp or db/synonyms.py bumps the synonyms version stamp
+RESPONSE_CACHE_TTL_SEC = int(os.getenv("RESPONSE_CACHE_TTL_SEC", "300"))
+VERSION_CHECK_INTERVAL_SEC = int(os.getenv("VERSION_CHECK_INTERVAL_SEC", "30"))
+response_cache = ResponseCache(int(os.getenv("RESPONSE_CACHE_SIZE", "1024")), RESPONSE_CACHE_TTL_SEC)
+data_version = None
+synonyms_version = None
+versions_checked_at = float("-inf")
+version_check_task = None
+
+
+async def refresh_versions():
+    """Check version stamps at most once per interval, in the background, so that requests are not blocked
+
+    Only the first check of this API instance is awaited, so that ETags are based on known versions
+    """
+    global versions_checked_at, version_check_task
+    if time.monotonic() - versions_checked_at < VERSION_CHECK_INTERVAL_SEC:
+        return
+    if version_check_task is not None and not version_check_task.done():
+        return
+    versions_checked_at = time.monotonic()
+    version_check_task = asyncio.create_task(check_versions())
+    if data_version is None:
+        await version_check_task
+
+
+async def check_versions():
+    """Get the data and synonyms version stamps and refresh cached state that has changed
+
+    If the data has changed, cached responses are dropped and the search engine snapshot is reloaded in the background
+    If the synonyms have changed (and were not loaded from a snapshot file), the synonyms map is reloaded and swapped in
+    """
+    global data_version, synonyms_version, synonymous_department_codes
+    try:
+        documents = await utils.get_database()["metadata"].find({"_id": {"$in": ["data_version", "synonyms_version"]}}).to_list()
+        versions = {document["_id"]: document["version"] for document in documents}
+
+        version = versions.get("data_version", 0)
+        if version != data_version:
+            if data_version is not None:
+                response_cache.clear()
+                search_engine.loaded = False  # Serve requests with Atlas Search until the new snapshot is loaded
+            data_version = version
+        start_loading_search_engine()
+
+        version = versions.get("synonyms_version", 0)
+        if version != synonyms_version:
+            if synonyms_version is not None and not SYNONYMS_SNAPSHOT:
+                synonymous_department_codes = await utils.load_synonyms("synonymous_department_codes")
+                response_cache.clear()
+                print(f"Reloaded synonyms (version {version})")
+            synonyms_version = version
+    except Exception as e:
+        print(f"Failed to check versions: {e}")
+
+
+def make_etag(key: tuple) -> str:
+    """Make an entity tag for a cache key, which changes whenever the data or synonyms version changes"""
+    digest = hashlib.sha1(repr((data_version, synonyms_version, *key)).encode()).hexdigest()
+    return f'"{digest[:20]}"'
 
 
 @app.get("/courses/{university_id}")
 async def get_courses(
     university_id: Annotated[str, Path(title="University ID")],
+    request: Request,
     limit: Annotated[int, Query(gt=0)] = None,
-    query: str = None
+    query: str = None,
+    cursor: str = None,
+    stream: bool = False,
+    fields: str = None
 ):
     """Get courses associated with a particular university
 
     If a query is given, get list of courses with matching course numbers (up to limit, if given)
-    If no query is given, get list of all courses associated with given university (up to limit, if given)
+    If no query is given, get a page of all courses associated with given university in order of course ID,
+    with up to limit courses (DEFAULT_PAGE_SIZE if not given, and at most MAX_PAGE_SIZE) starting after the given cursor
+    If the page is full, the X-Next-Cursor response header holds the cursor of the next page
+    If no query is given and stream is true, all courses (up to limit, if given) after the given cursor are streamed as NDJSON instead
+    If fields are given, only those fields (and _id) of each course are returned
+
+    Responses (other than streams) are cached by university ID, normalized query, limit, cursor, and fields,
+    and carry ETag and Cache-Control headers
+    A request whose If-None-Match header matches the current ETag gets an empty 304 response
 
     Args:
         university_id: University ID
         limit: Maximum number of courses returned
         query: Query to be matched against course numbers
+        cursor: Opaque cursor of a page of all courses, taken from the X-Next-Cursor header of the previous page
+        stream: Whether to stream all courses as NDJSON
+        fields: Comma-separated names of fields to return, or "summary" for course number and title only
 
     Returns:
         A list of dicts containing data on courses
     """
-    pipelines = []
-    if query:
-        query = query.upper()
-        query = query.strip()
-        query = re.sub("[^a-zA-Z0-9]", " ", query)  # Replace non-alphanumeric characters (i.e. dashes) with spaces
-        query = re.sub(" +", " ", query)  # Replace consecutive spaces with one space
-        query = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", query)  # Insert space between letter-digit boundaries
-        query = re.sub(r"(\d)([a-zA-Z])", r"\1 \2", query)  # Insert space between digit-letter boundaries
-
-        queries = [query]
-
-        # If query starts with a department code with synonyms, create query variations from synonyms
-        match = re.match("[A-Z]+", query)
-        if match is not None and match.group() in synonymous_department_codes:
-            for synonymous_department_code in synonymous_department_codes[match.group()]:
-                queries.append(re.sub("[A-Z]+", synonymous_department_code, query, count=1))
-
-        # Create an aggregation pipeline for each variation of the query
-        for query in queries:
-            pipeline = [
-                {
-                    "$search": {
-                        "index": "courses-index",
-                        "compound": {
-                            "should": [
-                                {  # Exact full text matching, accepts mapped department code synonyms
-                                    "text": {
-                                        "query": query,
-                                        "path": "number",
-                                        "synonyms": "department_codes_mapping"
-                                    }
-                                },
-                                {  # Fuzzy full text matching
-                                    "text": {
-                                        "query": query,
-                                        "path": "number",
-                                        "fuzzy": {
-                                            "maxEdits": 1,
-                                            "prefixLength": 1
-                                        }
-                                    }
-                                },
-                                {  # Exact autocomplete matching
-                                    "autocomplete": {
-                                        "query": query,
-                                        "path": "number",
-                                        "tokenOrder": "sequential"
-                                    }
-                                },
-                                {  # Fuzzy autocomplete matching
-                                    "autocomplete": {
-                                        "query": query,
-                                        "path": "number",
-                                        "fuzzy": {
-                                            "maxEdits": 1,
-                                            "prefixLength": 1
-                                        },
-                                        "tokenOrder": "sequential"
-                                    }
-                                }
-                            ],
-                            "filter": [
-                                {
-                                    "equals": {
-                                        "path": "university_id",
-                                        "value": university_id
-                                    }
-                                }
-                            ],
-                            "minimumShouldMatch": 2
-                        }
-                    }
-                }
-            ]
-            pipelines.append(pipeline)
-    else:
-        pipeline = [
-            {
-                "$search": {
-                    "index": "courses-index",
-                    "equals": {
-                        "path": "university_id",
-                        "value": university_id
-                    }
-                }
-            }
-        ]
-        pipelines.append(pipeline)
+    await refresh_versions()
 
-    if limit:
-        for pipeline in pipelines:
-            pipeline.append({"$limit": limit})
+    with timed("normalize"):
+        query = normalize_query(query) if query else None
+    after = decode_cursor(university_id, cursor) if cursor else None
+    fields = parse_fields(fields)
+    if query is None and stream:
+        return StreamingResponse(stream_courses(university_id, after, limit, fields), media_type="application/x-ndjson")
+    if query is None and limit is not None and limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Limit of a page of all courses must be at most {MAX_PAGE_SIZE}")
+
+    key = (university_id, query, limit, cursor, fields)
+    headers = {
+        "ETag": make_etag(key),
+        "Cache-Control": f"public, max-age={RESPONSE_CACHE_TTL_SEC}"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    with timed("cache"):
+        documents = response_cache.get(key)
+    if documents is None:
+        if query is not None:
+            documents = await find_courses(university_id, query, limit, fields)
+        else:
+            backend = get_search_backend(university_id)
+            documents = await backend.list_courses(university_id, after, limit or DEFAULT_PAGE_SIZE, fields)
+        response_cache.set(key, documents)
+    if query is None and len(documents) == (limit or DEFAULT_PAGE_SIZE):
+        headers["X-Next-Cursor"] = encode_cursor(documents[-1]["_id"])
+    with timed("serialize"):
+        return CourseJSONResponse(documents, headers=headers)
+
+
+@app.post("/courses/{university_id}/batch")
+async def get_courses_batch(
+    university_id: Annotated[str, Path(title="University ID")],
+    numbers: Annotated[list[str], Body(max_length=MAX_BATCH_LOOKUP_SIZE)],
+    fields: str = None
+):
+    """Look up many course numbers of a university at once, e.g. all course numbers found on a web page
+
+    Numbers are deduplicated after normalization, then resolved to exact course IDs (including department code
+    synonym variations) with a single query, and only numbers without an exact match fall back to search
+    (BATCH_SEARCH_CONCURRENCY searches at a time)
+
+    Args:
+        university_id: University ID
+        numbers: JSON array of course numbers
+        fields: Comma-separated names of fields to return, or "summary" for course number and title only
+
+    Returns:
+        A dict mapping each given course number to the data on its best matching course, or None if there is no match
+    """
+    await refresh_versions()
+
+    fields = parse_fields(fields)
+    queries = {}
+    for number in numbers:
+        query = normalize_query(number)
+        if query.strip():
+            queries[number] = query
+    synonymous_department_codes = await get_synonymous_department_codes()
+    candidate_ids = {
+        query: [course_id(university_id, variation) for variation in query_variations(query, synonymous_department_codes)]
+        for query in set(queries.values())
+    }
+    backend = get_search_backend(university_id)
+    courses = await backend.get_courses_by_id(university_id, {_id for _ids in candidate_ids.values() for _id in _ids}, fields)
+
+    matches = {}
+    for query, _ids in candidate_ids.items():
+        matches[query] = next((courses[_id] for _id in _ids if _id in courses), None)
+    misses = [query for query, match in matches.items() if match is None]
+    search_slots = asyncio.Semaphore(max(BATCH_SEARCH_CONCURRENCY, 1))
+
+    async def find_course(query: str) -> list[dict]:
+        async with search_slots:
+            return await find_courses(university_id, query, 1, fields)
+
+    results = await asyncio.gather(*[find_course(query) for query in misses])
+    for query, documents in zip(misses, results):
+        matches[query] = documents[0] if documents else None
+
+    with timed("serialize"):
+        return CourseJSONResponse({number: matches[queries[number]] if number in queries else None for number in numbers})
+
+
+@app.get("/courses/{university_id}/{course_id}")
+async def get_course(
+    university_id: Annotated[str, Path(title="University ID")],
+    course_id: Annotated[str, Path(title="Course ID")],
+    fields: str = None
+):
+    """Get the full data on one course of a university by its course ID (the _id of a course returned by other endpoints)
+
+    Args:
+        university_id: University ID
+        course_id: Course ID, e.g. duke_university-compsci_201
+        fields: Comma-separated names of fields to return, or "summary" for course number and title only
+
+    Returns:
+        A dict containing data on the course
+    """
+    await refresh_versions()
 
-    for pipeline in pipelines:
-        documents = db["courses"].aggregate(pipeline)
-        documents = await documents.to_list()
-        if len(documents) > 0:
-            break
+    courses = {}
+    if course_id.startswith(f"{university_id}-"):
+        backend = get_search_backend(university_id)
+        courses = await backend.get_courses_by_id(university_id, {course_id}, parse_fields(fields))
+    if course_id not in courses:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return CourseJSONResponse(courses[course_id])
 
-    return documents
+
+@app.get("/metrics")
+async def get_metrics():
+    """Get latency percentiles (p50/p95/p99) of this API instance by route, university, and request stage,
+    and counts of searches by number of query variations tried"""
+    return metrics.snapshot()
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get response cache statistics (size, hits, misses, evictions) of this API instance"""
+    return {"data_version": data_version, "synonyms_version": synonyms_version, **response_cache.stats()}
+
+
+async def find_courses(university_id: str, query: str, limit: int | None, fields: tuple | None = None) -> list[dict]:
+    """Find courses of a university matching a normalized query, with only the given fields (all fields if None)"""
+    backend = get_search_backend(university_id)
+
+    # If query starts with a department code with synonyms, create query variations from synonyms
+    synonymous_department_codes = await get_synonymous_department_codes()
+    queries = query_variations(query, synonymous_department_codes)
+
+    return await backend.search(university_id, queries, synonymous_department_codes, limit, fields)
+
+
+def encode_cursor(course_id: str) -> str:
+    return base64.urlsafe_b64encode(course_id.encode()).decode()
+
+
+def decode_cursor(university_id: str, cursor: str) -> str:
+    """Decode a cursor into the ID of the last course of the previous page, rejecting (with 400) anything that is not
+    strictly base64 or not a course ID of the university"""
+    try:
+        course_id = base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not course_id.startswith(f"{university_id}-") or course_id == f"{university_id}-":
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return course_id
+
+
+def parse_fields(fields: str | None) -> tuple | None:
+    """Parse the fields query parameter into a tuple of field names, or None if all fields are requested"""
+    if not fields:
+        return None
+    if fields == "summary":
+        return SUMMARY_FIELDS
+    return tuple(sorted({field.strip() for field in fields.split(",") if field.strip()})) or None
+
+
+def course_id(university_id: str, query: str) -> str:
+    """Get the course ID that db/writer.py would give a course with a number matching the normalized query
+
+    e.g. ("duke_university", "COMPSCI 201 L") -> "duke_university-compsci_201l"
+    """
+    department_code, *rest = query.split()
+    return f"{university_id}-{department_code.lower()}_{''.join(rest).lower()}"
+
+
+async def stream_courses(university_id: str, after: str | None, limit: int | None, fields: tuple | None = None):
+    """Yield NDJSON lines of courses of a university in order of course ID, in chunks of up to STREAM_BATCH_SIZE courses
+    (one cursor batch), so that each chunk is compressed as a whole"""
+    documents = utils.get_database()["courses"].find(
+        {"_id": course_id_range(university_id, after), "university_id": university_id},
+        projection(fields) if fields else None,
+        batch_size=STREAM_BATCH_SIZE
+    ).sort("_id", 1)
+    if limit:
+        documents = documents.limit(limit)
+    lines = []
+    async for document in documents:
+        lines.append(dumps(document) + b"\n")
+        if len(lines) >= STREAM_BATCH_SIZE:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
 
 
 handler = Mangum(app, lifespan="off")
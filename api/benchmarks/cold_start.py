@@ -0,0 +1,141 @@
+"""cold_start.py
+
+Program that measures API cold start: module import time and time to first response
+
+Locally, each measurement runs in a fresh Python process that imports api.py and invokes the Lambda handler
+With --image, each measurement starts a fresh container of the API image (which serves the Lambda Runtime
+Interface Emulator on port 8080) and times from `docker run` to the first successful invocation
+
+Usage (from the api directory):
+    python benchmarks/cold_start.py [--runs N] [--path /courses/duke_university?query=CS201&limit=1]
+    python benchmarks/cold_start.py --image course-compass-api [--runs N] [--port 9000]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Runs in a fresh interpreter: import the API module, then invoke the handler with an API Gateway (HTTP API) event
+LOCAL_RUN_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+response = api.handler(json.loads(sys.argv[1]), None)
+responded = time.perf_counter()
+print(json.dumps({
+    "import_sec": imported - start,
+    "first_response_sec": responded - start,
+    "status_code": response["statusCode"]
+}))
+"""
+
+
+def make_event(request_path: str) -> dict:
+    """Make an API Gateway HTTP API (payload format 2.0) event for a GET request to request_path"""
+    url = urlsplit(request_path)
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": url.path,
+        "rawQueryString": url.query,
+        "headers": {"host": "localhost"},
+        "requestContext": {
+            "http": {"method": "GET", "path": url.path, "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1", "userAgent": "cold_start"},
+            "stage": "$default"
+        },
+        "isBase64Encoded": False
+    }
+
+
+def measure_local(event: dict) -> dict:
+    """Measure import time and time to first response of api.py in a fresh process"""
+    process_start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", LOCAL_RUN_SCRIPT, json.dumps(event)],
+        cwd=API_DIR, capture_output=True, text=True, check=True
+    )
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement["process_sec"] = time.perf_counter() - process_start
+    return measurement
+
+
+def measure_import_breakdown(top: int = 10):
+    """Print the modules with the largest cumulative import times when importing api.py"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api"], cwd=API_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        rows.append((int(cumulative_us), module.rstrip()))
+    print(f"Top {top} modules by cumulative import time:")
+    for cumulative_us, module in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+
+
+def measure_container(image: str, event: dict, port: int, timeout_sec: float = 60) -> dict:
+    """Measure time from starting a container of image to its first successful invocation"""
+    url = f"http://localhost:{port}/2015-03-31/functions/function/invocations"
+    start = time.perf_counter()
+    command = ["docker", "run", "-d", "--rm", "-p", f"{port}:8080"]
+    if os.path.exists(os.path.join(API_DIR, ".env")):
+        command += ["--env-file", os.path.join(API_DIR, ".env")]
+    container_id = subprocess.run(command + [image], capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        while time.perf_counter() - start < timeout_sec:
+            try:
+                request = urllib.request.Request(url, data=json.dumps(event).encode(), method="POST")
+                with urllib.request.urlopen(request) as response:
+                    status_code = json.loads(response.read()).get("statusCode")
+                first_response_sec = time.perf_counter() - start
+
+                request = urllib.request.Request(url, data=json.dumps(event).encode(), method="POST")
+                warm_start = time.perf_counter()
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                return {
+                    "first_response_sec": first_response_sec,
+                    "warm_response_sec": time.perf_counter() - warm_start,
+                    "status_code": status_code
+                }
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise TimeoutError(f"Container did not respond within {timeout_sec} seconds")
+    finally:
+        subprocess.run(["docker", "stop", container_id], capture_output=True)
+
+
+def summarize(name: str, values: list[float]):
+    print(f"{name}: median {statistics.median(values) * 1000:.1f} ms, min {min(values) * 1000:.1f} ms, max {max(values) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/courses/duke_university?query=CS201&limit=1")
+    parser.add_argument("--image", help="Docker image of the API to measure instead of the local module")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    event = make_event(args.path)
+    if args.image:
+        measurements = [measure_container(args.image, event, args.port) for _ in range(args.runs)]
+        summarize("Container start to first response", [m["first_response_sec"] for m in measurements])
+        summarize("Warm response", [m["warm_response_sec"] for m in measurements])
+    else:
+        measurements = [measure_local(event) for _ in range(args.runs)]
+        summarize("Import", [m["import_sec"] for m in measurements])
+        summarize("Import to first response", [m["first_response_sec"] for m in measurements])
+        summarize("Process start to first response", [m["process_sec"] for m in measurements])
+        measure_import_breakdown()
+    print(f"Status codes: {sorted({m['status_code'] for m in measurements})}")
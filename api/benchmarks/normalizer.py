@@ -0,0 +1,78 @@
+"""normalizer.py
+
+Program that checks normalizer.py against the original multi-pass regex normalization and benchmarks both
+
+Equivalence is checked on random queries (mixing letters, digits, punctuation, whitespace, and non-ASCII characters)
+before timing, and timings are reported in ns/op for the original code, the uncached normalizer, and the memoized one
+
+Usage (from the api directory):
+    python benchmarks/normalizer.py [--samples N] [--seed S]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from normalizer import normalize_query, query_variations  # noqa: E402
+
+ALPHABET = "abcxyzABCXYZ0123456789 -_/.\t\n&()ßéıﬀ²"
+BENCHMARK_QUERIES = ["CS 201", "compsci201l", "  math-221 ", "STA 199", "cs-201", "AAAS 89S", "Computer Science 101"]
+SYNONYMS = {"CS": ["COMPSCI"], "COMPSCI": ["CS"], "STA": ["STAT", "STATS"], "STAT": ["STA", "STATS"], "STATS": ["STA", "STAT"]}
+
+
+def reference_normalize_query(query: str) -> str:
+    """Original normalization from get_courses"""
+    query = query.upper()
+    query = query.strip()
+    query = re.sub("[^a-zA-Z0-9]", " ", query)
+    query = re.sub(" +", " ", query)
+    query = re.sub(r"([a-zA-Z])(\d)", r"\1 \2", query)
+    query = re.sub(r"(\d)([a-zA-Z])", r"\1 \2", query)
+    return query
+
+
+def reference_query_variations(query: str, synonyms: dict) -> list[str]:
+    """Original creation of query variations from get_courses"""
+    queries = [query]
+    match = re.match("[A-Z]+", query)
+    if match is not None and match.group() in synonyms:
+        for synonymous_department_code in synonyms[match.group()]:
+            queries.append(re.sub("[A-Z]+", synonymous_department_code, query, count=1))
+    return queries
+
+
+def check_equivalence(samples: int, rng: random.Random):
+    """Check normalizer output against the original code on random queries, raising AssertionError on any difference"""
+    queries = BENCHMARK_QUERIES + ["", " ", "--", "-cs 201-"]
+    queries += ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 16))) for _ in range(samples)]
+    for query in queries:
+        expected = reference_normalize_query(query)
+        actual = normalize_query.__wrapped__(query)
+        assert actual == expected, f"normalize_query({query!r}) returned {actual!r}, expected {expected!r}"
+        expected = reference_query_variations(expected, SYNONYMS)
+        actual = query_variations(actual, SYNONYMS)
+        assert actual == expected, f"query_variations({query!r}) returned {actual!r}, expected {expected!r}"
+    print(f"Checked {len(queries)} queries: output identical to original normalization")
+
+
+def benchmark(name: str, function, number: int = 20000):
+    """Print time per query of function, averaged over the benchmark queries"""
+    seconds = min(timeit.repeat(lambda: [function(query) for query in BENCHMARK_QUERIES], number=number, repeat=5))
+    print(f"{name:<24} {seconds / (number * len(BENCHMARK_QUERIES)) * 1e9:8.0f} ns/op")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark query normalization")
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    check_equivalence(args.samples, random.Random(args.seed))
+    benchmark("Original", lambda query: reference_query_variations(reference_normalize_query(query), SYNONYMS))
+    benchmark("Normalizer (uncached)", lambda query: query_variations(normalize_query.__wrapped__(query), SYNONYMS))
+    benchmark("Normalizer (memoized)", lambda query: query_variations(normalize_query(query), SYNONYMS))
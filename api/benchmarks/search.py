@@ -0,0 +1,161 @@
+"""search.py
+
+Program that benchmarks course search with the local (in-process) search backend, without a database
+
+Synthetic corpora of courses spread over universities of about 13,000 courses each are searched with a realistic
+mix of queries (exact course numbers, typos, prefixes as typed in the extension, and synonymous department codes),
+going through the same normalization and query variations as the API
+Throughput and p50/p99 latency are reported for each corpus size, and with --max-p99-ms the program exits with
+an error if any p99 latency exceeds the threshold, so that regressions fail CI
+
+Usage (from the api directory):
+    python benchmarks/search.py [--sizes 13000,100000,1000000] [--queries N] [--max-p99-ms MS]
+"""
+
+import argparse
+import os
+import random
+import resource
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from normalizer import normalize_query, query_variations  # noqa: E402
+from search_backends import LocalSearchBackend  # noqa: E402
+from search_engine import CourseSearchEngine  # noqa: E402
+
+COURSES_PER_UNIVERSITY = 13000
+DEPARTMENTS_PER_UNIVERSITY = 150
+QUERY_MIX = {"exact": 0.4, "typo": 0.2, "prefix": 0.25, "synonym": 0.15}
+
+
+def make_departments(rng: random.Random) -> tuple[list[str], dict]:
+    """Make department codes, a third of which get a synonymous code (e.g. COMPSCI and CS), and the synonyms map"""
+    departments = set()
+    while len(departments) < DEPARTMENTS_PER_UNIVERSITY:
+        departments.add("".join(rng.choices(string.ascii_uppercase, k=rng.randint(2, 7))))
+    departments = sorted(departments)
+    synonyms = {}
+    for department in departments[::3]:
+        synonym = department[0] + "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 3)))
+        if synonym not in departments and synonym not in synonyms:
+            synonyms[department] = [synonym]
+            synonyms[synonym] = [department]
+    return departments, synonyms
+
+
+def make_corpus(size: int, rng: random.Random) -> tuple[list[dict], dict, dict]:
+    """Make course documents for enough universities to total size courses
+
+    Returns:
+        Course documents, the synonyms map, and a dict mapping each university ID to its course numbers
+    """
+    departments, synonyms = make_departments(rng)
+    documents = []
+    numbers_by_university = {}
+    for u in range((size + COURSES_PER_UNIVERSITY - 1) // COURSES_PER_UNIVERSITY):
+        university_id = f"university_{u}"
+        numbers = set()
+        while len(numbers) < min(COURSES_PER_UNIVERSITY, size - len(documents)):
+            numbers.add(f"{rng.choice(departments)} {rng.randint(1, 799)}{rng.choice(['', '', '', 'L', 'S', 'D'])}")
+        for number in sorted(numbers):
+            documents.append({
+                "_id": f"{university_id}-{'_'.join(number.lower().split())}",
+                "number": number,
+                "title": "Course Title",
+                "university_id": university_id
+            })
+        numbers_by_university[university_id] = sorted(numbers)
+    return documents, synonyms, numbers_by_university
+
+
+def make_query(kind: str, number: str, synonyms: dict, rng: random.Random) -> str:
+    """Make a query of the given kind from a course number"""
+    department, catalog_number = number.split(" ")
+    if kind == "typo":
+        i = rng.randrange(1, len(number))
+        if number[i] == " ":
+            i -= 1
+        return number[:i] + rng.choice(string.ascii_uppercase + string.digits) + number[i + 1:]
+    if kind == "prefix":
+        return number[:rng.randint(len(department) + 2, len(number))]
+    if kind == "synonym" and department in synonyms:
+        return f"{synonyms[department][0].lower()}{catalog_number}"
+    return number.lower().replace(" ", rng.choice([" ", "-", ""]))
+
+
+def make_queries(count: int, synonyms: dict, numbers_by_university: dict, rng: random.Random) -> list[tuple[str, str, str]]:
+    """Make (kind, university ID, query) tuples following QUERY_MIX"""
+    university_ids = list(numbers_by_university)
+    kinds = rng.choices(list(QUERY_MIX), weights=list(QUERY_MIX.values()), k=count)
+    queries = []
+    for kind in kinds:
+        university_id = rng.choice(university_ids)
+        number = rng.choice(numbers_by_university[university_id])
+        queries.append((kind, university_id, make_query(kind, number, synonyms, rng)))
+    return queries
+
+
+def run(coroutine):
+    """Run a coroutine that never waits on I/O (as with the local backend) to completion without an event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Search backend waited on I/O")
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def benchmark(size: int, query_count: int, rng: random.Random) -> float:
+    """Benchmark search over a corpus of size courses, returning the p99 latency in milliseconds"""
+    documents, synonyms, numbers_by_university = make_corpus(size, rng)
+    queries = make_queries(query_count, synonyms, numbers_by_university, rng)
+
+    max_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    engine = CourseSearchEngine()
+    engine.load(documents)
+    backend = LocalSearchBackend(engine)
+    build_sec = time.perf_counter() - start
+    max_rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = {kind: [] for kind in QUERY_MIX}
+    hits = 0
+    start = time.perf_counter()
+    for kind, university_id, query in queries:
+        query_start = time.perf_counter()
+        query = normalize_query(query)
+        documents = run(backend.search(university_id, query_variations(query, synonyms), synonyms, 10, ("number", "title")))
+        latencies[kind].append(time.perf_counter() - query_start)
+        hits += bool(documents)
+    total_sec = time.perf_counter() - start
+
+    print(f"{size} courses, {len(numbers_by_university)} universities: index built in {build_sec:.2f} s, "
+          f"peak RSS grew by {(max_rss_after - max_rss_before) / 1024:.0f} MB")
+    print(f"  {len(queries)} queries in {total_sec:.2f} s: {len(queries) / total_sec:.0f} queries/s, {hits / len(queries):.1%} with results")
+    all_latencies = sorted(latency for kind_latencies in latencies.values() for latency in kind_latencies)
+    for kind, kind_latencies in [*latencies.items(), ("all", all_latencies)]:
+        kind_latencies = sorted(kind_latencies)
+        if kind_latencies:
+            print(f"  {kind:<8} p50 {percentile(kind_latencies, 0.5) * 1e6:9.1f} us   p99 {percentile(kind_latencies, 0.99) * 1e6:9.1f} us")
+    return percentile(all_latencies, 0.99) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark course search with the local search backend")
+    parser.add_argument("--sizes", default="13000,100000,1000000", help="Comma-separated corpus sizes")
+    parser.add_argument("--queries", type=int, default=20000, help="Number of queries per corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p99-ms", type=float, help="Exit with an error if any p99 latency exceeds this")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    p99_ms = [benchmark(int(size), args.queries, rng) for size in args.sizes.split(",")]
+    if args.max_p99_ms is not None and max(p99_ms) > args.max_p99_ms:
+        print(f"p99 latency {max(p99_ms):.3f} ms exceeds {args.max_p99_ms} ms")
+        sys.exit(1)
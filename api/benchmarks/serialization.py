@@ -0,0 +1,92 @@
+"""serialization.py
+
+Program that benchmarks serialization and compression of course data responses
+
+Compares FastAPI's default path (jsonable_encoder then JSONResponse rendering) with serialization.dumps,
+and reports bytes on the wire with each content encoding, for a 50-result response and an all-courses response
+
+Usage (from the api directory):
+    python benchmarks/serialization.py [--courses N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from compression import brotli  # noqa: E402
+from serialization import dumps, orjson  # noqa: E402
+
+WORDS = "introduction to computer science data structures algorithms analysis theory systems design students will learn programming".split()
+
+
+def make_courses(count: int, rng: random.Random) -> list[dict]:
+    """Make synthetic course documents shaped like those written by db/writer.py"""
+    courses = []
+    for i in range(count):
+        number = f"{rng.choice(['COMPSCI', 'MATH', 'STA', 'ECON', 'AAAS'])} {rng.randint(1, 799)}{rng.choice(['', 'L', 'S'])}"
+        courses.append({
+            "_id": f"duke_university-{i}",
+            "title": " ".join(rng.choices(WORDS, k=4)).title(),
+            "number": number,
+            "codes": rng.sample(["ALP", "CZ", "NS", "QS", "SS", "W", "R"], k=2),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(40, 120))),
+            "prerequisites": None,
+            "typically_offered": "Fall and/or Spring",
+            "cross_listed_as": [],
+            "crse_id": str(rng.randint(0, 999999)).zfill(6),
+            "crse_offer_nbr": "1",
+            "university_id": "duke_university",
+            "department": number.split()[0],
+            "src": 1
+        })
+    return courses
+
+
+def time_per_call(function, min_time_sec: float = 1.0) -> float:
+    """Get the average time of calling function, repeating for at least min_time_sec"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time_sec:
+        function()
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def benchmark(name: str, courses: list[dict]):
+    print(f"{name} ({len(courses)} courses)")
+    default_sec = time_per_call(lambda: JSONResponse(jsonable_encoder(courses)).body)
+    fast_sec = time_per_call(lambda: dumps(courses))
+    print(f"  {'jsonable_encoder + JSONResponse':<34}{default_sec * 1000:10.3f} ms")
+    print(f"  {'dumps (' + ('orjson' if orjson else 'json') + ')':<34}{fast_sec * 1000:10.3f} ms ({default_sec / fast_sec:.1f}x faster)")
+
+    body = dumps(courses)
+    print(f"  {'identity':<34}{len(body):10} bytes")
+    encodings = [("gzip", lambda: gzip_compress(body))]
+    if brotli is not None:
+        encodings.append(("br", lambda: brotli.compress(body, quality=7)))
+    for encoding, compress in encodings:
+        compress_sec = time_per_call(compress)
+        print(f"  {encoding:<34}{len(compress()):10} bytes ({compress_sec * 1000:.3f} ms to compress)")
+
+
+def gzip_compress(body: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serialization and compression of course data")
+    parser.add_argument("--courses", type=int, default=13000, help="Number of courses in the all-courses response")
+    args = parser.parse_args()
+
+    courses = make_courses(args.courses, random.Random(0))
+    benchmark("50-result response", courses[:50])
+    benchmark("All-courses response", courses)
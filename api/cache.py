@@ -0,0 +1,59 @@
+"""cache.py
+
+In-memory response cache with LRU eviction and TTL expiry
+"""
+
+from collections import OrderedDict
+import time
+
+
+class ResponseCache:
+    """ResponseCache
+
+    Bounded cache mapping request keys to responses, evicting the least recently used entry when full
+    and treating entries older than the TTL as missing
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_sec: float = 300):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        """Get cached value of key, or None if key is not cached or its entry has expired"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.monotonic() < expires_at:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: tuple, value):
+        """Cache value of key, evicting the least recently used entry if cache is full"""
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl_sec, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_sec": self.ttl_sec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
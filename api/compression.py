@@ -0,0 +1,152 @@
+"""compression.py
+
+Response compression middleware negotiating Brotli or gzip encoding
+"""
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Brotli is only offered if the brotli package is installed
+    brotli = None
+
+
+def supported_encodings(encodings: list[str]) -> list[str]:
+    """Filter a list of content encodings (in order of preference) to those that can be used"""
+    return [encoding for encoding in encodings if encoding == "gzip" or (encoding == "br" and brotli is not None)]
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """Choose the most preferred of the given encodings accepted by the client (per Accept-Encoding), if any"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def weaken_etag(headers: MutableHeaders):
+    """Make the ETag header of a response weak (W/ prefix), if it has a strong one"""
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class Compressor:
+    """Incremental compressor for one response body
+
+    Compressed data is flushed (so the client can decode it) once flush_size bytes have been compressed since the last
+    flush, since flushing every small chunk of a stream resets the compression and inflates the stream
+    """
+
+    def __init__(self, encoding: str, level: int, flush_size: int = 0):
+        self.encoding = encoding
+        self.flush_size = flush_size
+        self.unflushed_size = 0
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=level)
+        else:
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits of 31 writes gzip format
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        """Compress a chunk of the body, flushing if flush_size bytes are unflushed, and ending the stream if finish"""
+        self.unflushed_size += len(data)
+        flush = finish or self.unflushed_size >= self.flush_size
+        if flush:
+            self.unflushed_size = 0
+        if self.encoding == "br":
+            compressed = self.compressor.process(data)
+            if finish:
+                return compressed + self.compressor.finish()
+            return compressed + self.compressor.flush() if flush else compressed
+        compressed = self.compressor.compress(data)
+        if finish:
+            return compressed + self.compressor.flush(zlib.Z_FINISH)
+        return compressed + self.compressor.flush(zlib.Z_SYNC_FLUSH) if flush else compressed
+
+
+class CompressionMiddleware:
+    """CompressionMiddleware
+
+    ASGI middleware compressing response bodies of at least minimum_size bytes (and all streamed responses)
+    with the first of encodings accepted by the client, flushing streamed responses every stream_flush_size bytes
+    The default brotli quality is the lowest at which brotli output is smaller than gzip's at the default level
+    (see benchmarks/serialization.py)
+    A compressed response's ETag is made weak, since its bytes differ from the identity response's (which keeps the
+    strong ETag), and so is the ETag of a 304 response to a client accepting one of encodings
+    """
+
+    def __init__(self, app, encodings: list[str], minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 7,
+                 stream_flush_size: int = 16384):
+        self.app = app
+        self.encodings = supported_encodings(encodings)
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        self.stream_flush_size = stream_flush_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http" and self.encodings:
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        started = False
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor, started
+            if message["type"] == "http.response.start":
+                start_message = message  # Held back until the first body chunk shows whether to compress
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not started:
+                started = True
+                headers = MutableHeaders(raw=start_message["headers"])
+                if start_message["status"] == 304:
+                    weaken_etag(headers)
+                    headers.add_vary_header("Accept-Encoding")
+                if "content-encoding" in headers or start_message["status"] in (204, 304) or (not more_body and len(body) < self.minimum_size):
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding, self.levels[encoding], self.stream_flush_size)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                weaken_etag(headers)
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                if not more_body:
+                    body = compressor.compress(body, finish=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            if compressor is None:
+                await send(message)
+                return
+            body = compressor.compress(body, finish=not more_body)
+            if body or not more_body:
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
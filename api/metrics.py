@@ -0,0 +1,191 @@
+"""metrics.py
+
+Request instrumentation: per-stage timings, Server-Timing headers, and latency histograms
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import time
+
+from starlette.datastructures import MutableHeaders
+
+current_timer = ContextVar("current_timer", default=None)
+
+# Histogram bucket upper bounds in seconds, growing by 25% from 0.1 ms to about 36 s
+BUCKET_BOUNDS = [0.0001 * 1.25 ** i for i in range(58)]
+
+
+class RequestTimer:
+    """RequestTimer
+
+    Timer of one request, recording the total duration of each named stage and counters such as query variations tried
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time.perf_counter() - start
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Format stage durations as a Server-Timing header value (durations in milliseconds)"""
+        metrics = [f"{name};dur={duration * 1000:.3f}" for name, duration in self.stages.items()]
+        metrics.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ", ".join(metrics)
+
+
+@contextmanager
+def timed(name: str):
+    """Time a stage of the current request (no-op outside of a request)"""
+    timer = current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def count(name: str, value: int):
+    """Set a counter of the current request (no-op outside of a request)"""
+    timer = current_timer.get()
+    if timer is not None:
+        timer.counters[name] = value
+
+
+class LatencyHistogram:
+    """Histogram of durations with exponential buckets, from which quantiles are estimated"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, duration: float):
+        self.buckets[bisect_left(BUCKET_BOUNDS, duration)] += 1
+        self.count += 1
+        self.sum += duration
+
+    def quantile(self, q: float) -> float:
+        """Estimate quantile q as the upper bound of the bucket containing it"""
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return BUCKET_BOUNDS[min(i, len(BUCKET_BOUNDS) - 1)]
+        return 0.0
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000
+        }
+
+
+class Metrics:
+    """Metrics
+
+    Latency histograms of this API instance by route, by university, and by request stage,
+    plus a histogram of the number of query variations tried per search
+    Universities are taken from request paths, so that requests for arbitrary IDs cannot grow memory, only the
+    known_university_ids get their own histogram if given, and otherwise only the first max_university_labels
+    universities seen do, and all others are grouped under "other"
+    """
+
+    def __init__(self, known_university_ids: set | None = None, max_university_labels: int = 64):
+        self.histograms = {"route": {}, "university": {}, "stage": {}}
+        self.variations_tried = {}
+        self.known_university_ids = known_university_ids
+        self.max_university_labels = max_university_labels
+
+    def get_university_label(self, university_id: str) -> str:
+        """Get the label of a university's histogram, which is "other" for unknown universities or beyond the cap"""
+        if self.known_university_ids is not None:
+            return university_id if university_id in self.known_university_ids else "other"
+        histograms = self.histograms["university"]
+        if university_id in histograms or len(histograms) < self.max_university_labels:
+            return university_id
+        return "other"
+
+    def observe(self, route: str, university_id: str | None, timer: RequestTimer):
+        duration = timer.elapsed()
+        self.histograms["route"].setdefault(route, LatencyHistogram()).observe(duration)
+        if university_id is not None:
+            self.histograms["university"].setdefault(self.get_university_label(university_id), LatencyHistogram()).observe(duration)
+        for name, stage_duration in timer.stages.items():
+            self.histograms["stage"].setdefault(name, LatencyHistogram()).observe(stage_duration)
+        if "variations" in timer.counters:
+            variations = timer.counters["variations"]
+            self.variations_tried[variations] = self.variations_tried.get(variations, 0) + 1
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            kind: {label: histogram.summary() for label, histogram in histograms.items()}
+            for kind, histograms in self.histograms.items()
+        }
+        snapshot["variations_tried"] = dict(sorted(self.variations_tried.items()))
+        return snapshot
+
+
+class TimingMiddleware:
+    """TimingMiddleware
+
+    ASGI middleware that times each HTTP request, adds a Server-Timing header with its stage durations,
+    records it in metrics, and optionally prints a structured (JSON) log line
+    """
+
+    def __init__(self, app, metrics: Metrics, log_requests: bool = False):
+        self.app = app
+        self.metrics = metrics
+        self.log_requests = log_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        status = None
+
+        async def timing_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(raw=message["headers"]).append("Server-Timing", timer.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            current_timer.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            university_id = scope.get("path_params", {}).get("university_id")
+            self.metrics.observe(f"{scope['method']} {route}", university_id, timer)
+            if self.log_requests:
+                print(json.dumps({
+                    "method": scope["method"],
+                    "route": route,
+                    "path": scope["path"],
+                    "query_string": scope.get("query_string", b"").decode(errors="replace"),
+                    "university_id": university_id,
+                    "status": status,
+                    "duration_ms": round(timer.elapsed() * 1000, 3),
+                    "stages_ms": {name: round(duration * 1000, 3) for name, duration in timer.stages.items()},
+                    **timer.counters
+                }))
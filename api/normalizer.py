@@ -0,0 +1,50 @@
+"""normalizer.py
+
+Query normalization for course number searches
+"""
+
+from functools import lru_cache
+import re
+
+TOKEN_PATTERN = re.compile("[A-Z]+|[0-9]+")
+DEPARTMENT_CODE_PATTERN = re.compile("[A-Z]+")
+ALPHANUMERIC_CHARACTERS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+
+
+@lru_cache(maxsize=4096)
+def normalize_query(query: str) -> str:
+    """Normalize a course number query in a single pass, e.g. "cs-201l" -> "CS 201 L"
+
+    Equivalent to uppercasing and stripping the query, replacing non-alphanumeric characters with spaces,
+    collapsing consecutive spaces, and inserting spaces at letter-digit and digit-letter boundaries,
+    so a query that starts or ends with a non-alphanumeric character keeps one leading or trailing space
+
+    Args:
+        query: Query to be matched against course numbers
+
+    Returns:
+        The normalized query
+    """
+    query = query.upper().strip()
+    if not query:
+        return query
+
+    normalized = " ".join(TOKEN_PATTERN.findall(query))
+    if not normalized:
+        return " "
+    if query[0] not in ALPHANUMERIC_CHARACTERS:
+        normalized = " " + normalized
+    if query[-1] not in ALPHANUMERIC_CHARACTERS:
+        normalized = normalized + " "
+    return normalized
+
+
+def query_variations(query: str, synonyms: dict) -> list[str]:
+    """Get variations of a normalized query, the query itself first, then one per synonym of its leading department code"""
+    queries = [query]
+    match = DEPARTMENT_CODE_PATTERN.match(query)
+    if match is not None and match.group() in synonyms:
+        rest = query[match.end():]
+        for synonymous_department_code in synonyms[match.group()]:
+            queries.append(synonymous_department_code + rest)
+    return queries
@@ -0,0 +1,207 @@
+"""search_backends.py
+
+Search backends that find courses for the API: Atlas Search, and the in-process search engine
+"""
+
+import asyncio
+
+from metrics import count, timed
+from search_engine import CourseSearchEngine
+
+
+def projection(fields: tuple) -> dict:
+    """Make a MongoDB projection including the given fields (_id is always included)"""
+    return {field: 1 for field in fields}
+
+
+def project(documents: list[dict], fields: tuple | None) -> list[dict]:
+    """Project documents held in memory (i.e. by the search engine) to the given fields, like a $project stage"""
+    if not fields:
+        return documents
+    fields = ("_id", *fields)
+    return [{field: document[field] for field in fields if field in document} for document in documents]
+
+
+def course_id_range(university_id: str, after: str | None) -> dict:
+    """Get filter on course IDs (formatted {university_id}-{course}, see db/writer.py) of a university after a given course ID
+
+    The range ends at "{university_id}.", the smallest string after every string with prefix "{university_id}-",
+    so that listing courses is a scan of the _id index
+    """
+    return {"$gt": after or f"{university_id}-", "$lt": f"{university_id}."}
+
+
+class SearchBackend:
+    """SearchBackend
+
+    Interface of a search backend
+    Every method returns course documents with only the given fields (and _id), or all fields if fields is None
+    """
+
+    def has_university(self, university_id: str) -> bool:
+        """Check if the backend can serve courses of the university"""
+        raise NotImplementedError
+
+    async def search(self, university_id: str, queries: list[str], synonyms: dict, limit: int | None, fields: tuple | None) -> list[dict]:
+        """Search courses of a university by number with variations of a normalized query, in order of priority
+
+        Args:
+            university_id: University ID
+            queries: Variations of a normalized query (see normalizer.query_variations)
+            synonyms: Map of department codes to their synonymous department codes
+            limit: Maximum number of courses returned
+            fields: Names of fields to return
+
+        Returns:
+            Matching courses of the first variation with any matches, in descending order of relevance
+        """
+        raise NotImplementedError
+
+    async def get_courses_by_id(self, university_id: str, course_ids: set[str], fields: tuple | None) -> dict:
+        """Get courses of a university with the given course IDs, as a dict mapping course ID to course data"""
+        raise NotImplementedError
+
+    async def list_courses(self, university_id: str, after: str | None, page_size: int, fields: tuple | None) -> list[dict]:
+        """Get a page of courses of a university in order of course ID, starting after the given course ID (keyset pagination)"""
+        raise NotImplementedError
+
+
+class AtlasSearchBackend(SearchBackend):
+    """AtlasSearchBackend
+
+    Search backend querying the courses collection with the courses-index Atlas Search index
+    """
+
+    def __init__(self, get_database):
+        self.get_database = get_database
+
+    def has_university(self, university_id: str) -> bool:
+        return True
+
+    async def search(self, university_id: str, queries: list[str], synonyms: dict, limit: int | None, fields: tuple | None) -> list[dict]:
+        # Create an aggregation pipeline for each variation of the query
+        pipelines = []
+        for query in queries:
+            pipeline = [
+                {
+                    "$search": {
+                        "index": "courses-index",
+                        "compound": {
+                            "should": [
+                                {  # Exact full text matching, accepts mapped department code synonyms
+                                    "text": {
+                                        "query": query,
+                                        "path": "number",
+                                        "synonyms": "department_codes_mapping"
+                                    }
+                                },
+                                {  # Fuzzy full text matching
+                                    "text": {
+                                        "query": query,
+                                        "path": "number",
+                                        "fuzzy": {
+                                            "maxEdits": 1,
+                                            "prefixLength": 1
+                                        }
+                                    }
+                                },
+                                {  # Exact autocomplete matching
+                                    "autocomplete": {
+                                        "query": query,
+                                        "path": "number",
+                                        "tokenOrder": "sequential"
+                                    }
+                                },
+                                {  # Fuzzy autocomplete matching
+                                    "autocomplete": {
+                                        "query": query,
+                                        "path": "number",
+                                        "fuzzy": {
+                                            "maxEdits": 1,
+                                            "prefixLength": 1
+                                        },
+                                        "tokenOrder": "sequential"
+                                    }
+                                }
+                            ],
+                            "filter": [
+                                {
+                                    "equals": {
+                                        "path": "university_id",
+                                        "value": university_id
+                                    }
+                                }
+                            ],
+                            "minimumShouldMatch": 2
+                        }
+                    }
+                }
+            ]
+            pipelines.append(pipeline)
+
+        if limit:
+            for pipeline in pipelines:
+                pipeline.append({"$limit": limit})
+        if fields:
+            for pipeline in pipelines:
+                pipeline.append({"$project": projection(fields)})
+
+        # Run pipelines of all query variations concurrently, so worst-case latency is one round trip
+        # Results are still chosen in order of priority: the first variation with any matches wins
+        courses = self.get_database()["courses"]
+        with timed("db"):
+            results = await asyncio.gather(*[courses.aggregate(pipeline).to_list() for pipeline in pipelines])
+        count("variations", len(pipelines))
+        for documents in results:
+            if len(documents) > 0:
+                break
+        return documents
+
+    async def get_courses_by_id(self, university_id: str, course_ids: set[str], fields: tuple | None) -> dict:
+        documents = self.get_database()["courses"].find(
+            {"_id": {"$in": list(course_ids)}},
+            projection(fields) if fields else None
+        )
+        with timed("db"):
+            documents = await documents.to_list()
+        return {document["_id"]: document for document in documents}
+
+    async def list_courses(self, university_id: str, after: str | None, page_size: int, fields: tuple | None) -> list[dict]:
+        documents = self.get_database()["courses"].find(
+            {"_id": course_id_range(university_id, after), "university_id": university_id},
+            projection(fields) if fields else None
+        ).sort("_id", 1).limit(page_size)
+        with timed("db"):
+            return await documents.to_list()
+
+
+class LocalSearchBackend(SearchBackend):
+    """LocalSearchBackend
+
+    Search backend answering from the in-process search engine, which reproduces the should and filter clauses
+    of the courses-index compound query (see db/search_indexes/courses_index.json) without a database round trip
+    """
+
+    def __init__(self, engine: CourseSearchEngine):
+        self.engine = engine
+
+    def has_university(self, university_id: str) -> bool:
+        return self.engine.has_university(university_id)
+
+    async def search(self, university_id: str, queries: list[str], synonyms: dict, limit: int | None, fields: tuple | None) -> list[dict]:
+        with timed("search"):
+            for variations_tried, query in enumerate(queries, start=1):
+                documents = self.engine.search(university_id, query, synonyms, limit)
+                if len(documents) > 0:
+                    break
+            count("variations", variations_tried)
+            return project(documents, fields)
+
+    async def get_courses_by_id(self, university_id: str, course_ids: set[str], fields: tuple | None) -> dict:
+        with timed("search"):
+            courses = self.engine.get_courses_by_id(university_id, course_ids)
+            return {_id: project([course], fields)[0] for _id, course in courses.items()}
+
+    async def list_courses(self, university_id: str, after: str | None, page_size: int, fields: tuple | None) -> list[dict]:
+        with timed("search"):
+            return project(self.engine.all_courses(university_id, page_size, after), fields)
@@ -0,0 +1,237 @@
+"""search_engine.py
+
+In-process search engine over course numbers, mirroring the courses-index Atlas Search compound query
+"""
+
+from bisect import bisect_left, bisect_right
+import re
+
+TOKEN_PATTERN = re.compile("[A-Z0-9]+")
+MAX_GRAMS = 15  # Longest edgeGram indexed by the Atlas autocomplete mapping
+
+
+def tokenize(number: str) -> list[str]:
+    """Split a course number into uppercase alphanumeric tokens, e.g. "Compsci 201L" -> ["COMPSCI", "201L"]"""
+    return TOKEN_PATTERN.findall(number.upper())
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Check if strings a and b are at most one edit (insertion, deletion, substitution, transposition) apart
+
+    Mirrors Atlas Search fuzzy matching with maxEdits 1 and prefixLength 1, so the first characters must be equal
+    """
+    if a == b:
+        return True
+    if not a or not b or a[0] != b[0] or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+
+
+def deletion_variants(token: str) -> set[str]:
+    """Get the token along with every string formed by deleting one of its characters after the first"""
+    return {token} | {token[:i] + token[i + 1:] for i in range(1, len(token))}
+
+
+class TrieNode:
+    """Node of a prefix trie storing the indices of all documents in its subtree"""
+
+    __slots__ = ("children", "documents")
+
+    def __init__(self):
+        self.children = {}
+        self.documents = []
+
+
+class UniversityIndex:
+    """UniversityIndex
+
+    Search index over the course numbers of a single university
+
+    Exact and fuzzy (edit distance 1) token lookups use an inverted index plus a deletion-neighborhood index,
+    while exact and fuzzy sequential autocomplete use a prefix trie over every token suffix of each course number
+    """
+
+    def __init__(self, documents: list[dict]):
+        self.documents = sorted(documents, key=lambda document: document["_id"])
+        self.ids = [document["_id"] for document in self.documents]
+        self.numbers = []
+        self.postings = {}
+        self.deletions = {}
+        self.trie = TrieNode()
+
+        for index, document in enumerate(self.documents):
+            tokens = tokenize(document.get("number", ""))
+            self.numbers.append(" ".join(tokens))
+            for token in set(tokens):
+                self.postings.setdefault(token, []).append(index)
+                for variant in deletion_variants(token):
+                    self.deletions.setdefault(variant, set()).add(token)
+            for i in range(len(tokens)):
+                self.insert(" ".join(tokens[i:]), index)
+
+    def insert(self, text: str, index: int):
+        """Insert text into the prefix trie, recording document index at every node along its path"""
+        node = self.trie
+        for char in text:
+            node = node.children.setdefault(char, TrieNode())
+            if not node.documents or node.documents[-1] != index:
+                node.documents.append(index)
+
+    def exact_token_matches(self, tokens: set[str]) -> set[int]:
+        """Get indices of documents containing any of the given tokens"""
+        return {index for token in tokens for index in self.postings.get(token, ())}
+
+    def fuzzy_token_matches(self, token: str) -> set[int]:
+        """Get indices of documents containing a token within one edit of the given token"""
+        candidates = set()
+        for variant in deletion_variants(token):
+            candidates |= self.deletions.get(variant, set())
+        return {index for candidate in candidates if within_one_edit(token, candidate) for index in self.postings[candidate]}
+
+    def prefix_matches(self, text: str) -> set[int]:
+        """Get indices of documents with a token sequence starting with text"""
+        node = self.trie
+        for char in text:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return set(node.documents)
+
+    def fuzzy_prefix_matches(self, text: str) -> set[int]:
+        """Get indices of documents with a token sequence starting with a string within one edit of text"""
+        matches = set()
+        if not text:
+            return matches
+        first = self.trie.children.get(text[0])
+        if first is None:
+            return matches
+
+        # Depth-first walk of the trie, allowing a single edit anywhere after the first character
+        stack = [(first, 1, 1)]
+        while stack:
+            node, i, edits = stack.pop()
+            if i == len(text):
+                matches.update(node.documents)
+                continue
+            child = node.children.get(text[i])
+            if child is not None:
+                stack.append((child, i + 1, edits))
+            if edits:
+                stack.append((node, i + 1, 0))  # Deletion
+                for char, other_child in node.children.items():
+                    if char != text[i]:
+                        stack.append((other_child, i + 1, 0))  # Substitution
+                    stack.append((other_child, i, 0))  # Insertion
+                if i + 1 < len(text):  # Transposition
+                    swapped = node.children.get(text[i + 1])
+                    swapped = swapped and swapped.children.get(text[i])
+                    if swapped is not None:
+                        stack.append((swapped, i + 2, 0))
+        return matches
+
+    def search(self, query: str, synonyms: dict, limit: int = None) -> list[dict]:
+        """Search documents with the same should clauses as the Atlas compound query, requiring 2 to match
+
+        Each matched clause adds to a document's score: exact text matching (weighted by the fraction of query tokens
+        matched, accepting department code synonyms), fuzzy text matching, exact autocomplete matching, and fuzzy
+        autocomplete matching
+        Ties are broken by shorter, then lexicographically smaller, course numbers
+
+        Args:
+            query: Normalized query
+            synonyms: Map of department codes to their synonymous department codes
+            limit: Maximum number of documents returned
+
+        Returns:
+            A list of matching documents, in descending order of relevance
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        text = " ".join(tokens)
+
+        exact_counts = {}
+        fuzzy_counts = {}
+        for token in tokens:
+            for index in self.exact_token_matches({token, *synonyms.get(token, ())}):
+                exact_counts[index] = exact_counts.get(index, 0) + 1
+            for index in self.fuzzy_token_matches(token):
+                fuzzy_counts[index] = fuzzy_counts.get(index, 0) + 1
+        autocomplete = set()
+        fuzzy_autocomplete = set()
+        if all(len(token) <= MAX_GRAMS for token in tokens):
+            autocomplete = self.prefix_matches(text)
+            fuzzy_autocomplete = self.fuzzy_prefix_matches(text)
+
+        scored = []
+        for index in exact_counts.keys() | fuzzy_counts.keys() | fuzzy_autocomplete:
+            matched_clauses = (index in exact_counts) + (index in fuzzy_counts) + (index in autocomplete) + (index in fuzzy_autocomplete)
+            if matched_clauses < 2:
+                continue
+            score = (
+                2 * exact_counts.get(index, 0) / len(tokens)
+                + fuzzy_counts.get(index, 0) / len(tokens)
+                + (index in autocomplete)
+                + 0.5 * (index in fuzzy_autocomplete)
+                + (self.numbers[index] == text)
+            )
+            scored.append((-score, len(self.numbers[index]), self.numbers[index], index))
+
+        scored.sort()
+        if limit:
+            scored = scored[:limit]
+        return [self.documents[index] for *_, index in scored]
+
+
+class CourseSearchEngine:
+    """CourseSearchEngine
+
+    Search engine holding a snapshot of the courses collection in memory, with one index per university
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.loaded = False
+
+    def load(self, documents: list[dict]):
+        """Build indexes from a snapshot of documents in the courses collection"""
+        documents_by_university = {}
+        for document in documents:
+            documents_by_university.setdefault(document.get("university_id"), []).append(document)
+        self.indexes = {
+            university_id: UniversityIndex(university_documents)
+            for university_id, university_documents in documents_by_university.items()
+        }
+        self.loaded = True
+
+    def has_university(self, university_id: str) -> bool:
+        return university_id in self.indexes
+
+    def search(self, university_id: str, query: str, synonyms: dict, limit: int = None) -> list[dict]:
+        """Search a university's courses by normalized query (see UniversityIndex.search)"""
+        return self.indexes[university_id].search(query, synonyms, limit)
+
+    def get_courses_by_id(self, university_id: str, course_ids: set[str]) -> dict:
+        """Get courses of a university with the given course IDs, as a dict mapping course ID to course data"""
+        index = self.indexes[university_id]
+        courses = {}
+        for course_id in course_ids:
+            i = bisect_left(index.ids, course_id)
+            if i < len(index.ids) and index.ids[i] == course_id:
+                courses[course_id] = index.documents[i]
+        return courses
+
+    def all_courses(self, university_id: str, limit: int = None, after: str = None) -> list[dict]:
+        """Get all courses of a university in order of course ID, starting after the given course ID (up to limit, if given)"""
+        index = self.indexes[university_id]
+        start = bisect_right(index.ids, after) if after is not None else 0
+        return index.documents[start:start + limit] if limit else index.documents[start:]
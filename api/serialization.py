@@ -0,0 +1,33 @@
+"""serialization.py
+
+Fast JSON serialization of course data
+"""
+
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library if orjson is not installed
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """Serialize content (course data from the database, i.e. dicts, lists, strings, numbers, None) to compact JSON bytes
+
+    Course data needs none of the conversions of FastAPI's jsonable_encoder, so it is serialized directly,
+    with orjson if available
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+class CourseJSONResponse(Response):
+    """JSON response that serializes course data with dumps, skipping jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
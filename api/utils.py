@@ -4,18 +4,35 @@ API utilities
 """
 
 import os
+import json
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
 load_dotenv()
 
 uri = os.getenv("MONGODB_URI")
-client = MongoClient(uri)
-db = client["db"]
+client = None
 
 
-def load_synonyms(collection: str) -> dict:
+def get_database():
+    """Get the database through the API's only Mongo client, which is created (and Motor imported) on first use"""
+    global client
+    if client is None:
+        import motor.motor_asyncio
+        client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+    return client["db"]
+
+
+def build_synonyms_map(synonym_groups: list[list[str]]) -> dict:
+    """Build the adjacency list representation of a graph that connects all synonyms in each group"""
+    synonyms_map = {}
+    for synonyms in synonym_groups:
+        for i, synonym in enumerate(synonyms):
+            synonyms_map[synonym] = synonyms[:i] + synonyms[i + 1:]
+    return synonyms_map
+
+
+async def load_synonyms(collection: str) -> dict:
     """Load synonyms stored in specified collection of the database
 
     Given name of a collection in the database, load all documents in collection (each document
@@ -37,10 +54,22 @@ def load_synonyms(collection: str) -> dict:
     Returns:
         A dict that maps strings to a list of their synonyms as defined in the specified collection
     """
-    synonyms_map = {}
-    documents = db[collection].find().to_list()
-    for document in documents:
-        synonyms = document["synonyms"]
-        for i, synonym in enumerate(synonyms):
-            synonyms_map[synonym] = synonyms[:i] + synonyms[i + 1:]
-    return synonyms_map
+    documents = await get_database()[collection].find().to_list()
+    return build_synonyms_map([document["synonyms"] for document in documents])
+
+
+def load_university_ids(file_path: str) -> set:
+    """Load the IDs of universities from a file in the format of universities.json (university IDs mapped to their data)"""
+    with open(file_path, "r") as file:
+        return set(json.load(file))
+
+
+def load_synonyms_snapshot(file_path: str) -> dict:
+    """Load synonyms from a snapshot file in the format of db/synonyms (names of synonym groups mapped to lists of synonyms)
+
+    Returns:
+        A dict in the same format as load_synonyms
+    """
+    with open(file_path, "r") as file:
+        synonyms = json.load(file)
+    return build_synonyms_map(list(synonyms.values()))
@@ -0,0 +1,58 @@
+"""convert_cache.py
+
+Program that converts the scraped data in the cache directory from JSON files to sharded stores (see sharded_store.py)
+
+Each dict JSON file listed in SHARDED_FILES (e.g. cache/<university>/<source>/course_data.json) is converted to a
+sharded store next to it (course_data.shards), with one shard per key (department or subject)
+
+Usage (from the db directory):
+    python convert_cache.py [--delete-json]
+"""
+
+import os
+import json
+import time
+import argparse
+
+from sharded_store import ShardedStore, get_shards_path
+
+CACHE_DIR = os.path.join("..", "cache")
+
+SHARDED_FILES = ["course_data.json", "course_list.json"]
+
+
+def get_size(file_path: str) -> int:
+    """Get the size of a file, or the total size of the files in a directory"""
+    if os.path.isdir(file_path):
+        return sum(os.path.getsize(os.path.join(file_path, file_name)) for file_name in os.listdir(file_path))
+    return os.path.getsize(file_path)
+
+
+def convert(json_file_path: str) -> ShardedStore:
+    """Convert a JSON file to a sharded store, replacing the store if it exists"""
+    with open(json_file_path, "r") as file:
+        data = json.load(file)
+    store = ShardedStore(get_shards_path(json_file_path))
+    store.clear()
+    store.update(data)
+    store.save()
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert scraped data in the cache directory to sharded stores")
+    parser.add_argument("--delete-json", action="store_true", help="Delete JSON files once converted")
+    args = parser.parse_args()
+
+    for root, dir_names, file_names in os.walk(CACHE_DIR):
+        dir_names[:] = [dir_name for dir_name in dir_names if not dir_name.endswith(".shards")]
+        for file_name in file_names:
+            if file_name not in SHARDED_FILES:
+                continue
+            json_file_path = os.path.join(root, file_name)
+            start_time = time.time()
+            store = convert(json_file_path)
+            print(f"Converted {json_file_path}: {len(store)} shards, {get_size(json_file_path) / 1e6:.2f} MB -> "
+                  f"{get_size(store.dir_path) / 1e6:.2f} MB in {time.time() - start_time:.2f} seconds")
+            if args.delete_json:
+                os.remove(json_file_path)
@@ -0,0 +1,102 @@
+"""course_data_reader.py
+
+Incremental reader for scraped course data (cache/<university>/<source>/course_data.shards, or course_data.json)
+"""
+
+import json
+
+from sharded_store import ShardedStore, get_shards_path
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+
+
+class CourseDataReader:
+    """CourseDataReader
+
+    Reader that parses a course data file, a JSON object mapping departments to lists of course data dicts,
+    one course at a time, so that only the current chunk of the file and one course are held in memory
+    """
+
+    def __init__(self, file, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read the next chunk of the file into the buffer, dropping the consumed part, and return False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and get the next character without consuming it ("" at end of file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters: str) -> str:
+        """Consume the next character, which must be one of the given characters"""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r} in course data file, found {character!r}")
+        self.pos += 1
+        return character
+
+    def decode(self):
+        """Decode the next JSON value (a string or an object, so the end of a value is never ambiguous), reading more of the file as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+    def __iter__(self):
+        """Yield (department, course data) pairs in file order"""
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            department = self.decode()
+            self.expect(":")
+            self.expect("[")
+            if self.peek() == "]":
+                self.pos += 1
+            else:
+                while True:
+                    yield department, self.decode()
+                    if self.expect(",]") == "]":
+                        break
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_course_data(file_path: str):
+    """Yield (department, course data) pairs from a course data file without loading the whole file
+
+    If the course data has been converted to a sharded store, the store is read instead, one department shard at a time
+    """
+    store = ShardedStore(get_shards_path(file_path))
+    if store.exists():
+        for department in store:
+            for course_data in store.load_shard(department):
+                yield department, course_data
+        return
+
+    with open(file_path, "r") as file:
+        yield from CourseDataReader(file)
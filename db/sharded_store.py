@@ -0,0 +1,128 @@
+"""sharded_store.py
+
+Compact, sharded storage of scraped data in the cache directory (e.g. course data with one shard per department)
+
+A store is a directory (e.g. cache/<university>/<source>/course_data.shards) holding one gzip-compressed compact JSON
+file per key and an index.json listing the keys in order with their shard file names and content hashes
+Opening a store reads only its index, shards are read when their keys are accessed, and saving writes only the
+shards whose content changed
+"""
+
+import os
+import re
+import gzip
+import json
+import hashlib
+from collections.abc import MutableMapping
+
+SHARDS_SUFFIX = ".shards"
+INDEX_FILE_NAME = "index.json"
+SHARD_FILE_SUFFIX = ".json.gz"
+
+
+def get_shard_file_name(key: str) -> str:
+    """Get a file name for a key's shard, readable but safe for any key (e.g. "Latino/a Studies in the Global South")"""
+    slug = re.sub("[^A-Za-z0-9]+", "_", key).strip("_")[:40]
+    return f"{slug}-{hashlib.sha1(key.encode()).hexdigest()[:8]}{SHARD_FILE_SUFFIX}"
+
+
+def get_shards_path(json_file_path: str) -> str:
+    """Get the path of the store replacing a JSON file, e.g. course_data.json -> course_data.shards"""
+    return os.path.splitext(json_file_path)[0] + SHARDS_SUFFIX
+
+
+def write_file_atomically(file_path: str, data: bytes):
+    """Write a file so that a crash leaves either the old or the new file, never a partial one"""
+    temp_file_path = f"{file_path}.tmp"
+    with open(temp_file_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file_path, file_path)
+
+
+class ShardedStore(MutableMapping):
+    """ShardedStore
+
+    Dict-like store of JSON values by string key, each value stored in its own compressed shard file and read on first access
+    """
+
+    def __init__(self, dir_path: str):
+        self.dir_path = dir_path
+        self.shards = {}  # Maps each key, in order, to its shard file name and content hash
+        self.loaded_values = {}  # Values of the keys accessed so far
+        if os.path.exists(os.path.join(dir_path, INDEX_FILE_NAME)):
+            with open(os.path.join(dir_path, INDEX_FILE_NAME), "r") as file:
+                for shard in json.load(file):
+                    self.shards[shard["key"]] = {"file": shard["file"], "hash": shard["hash"]}
+
+    @classmethod
+    def open(cls, dir_path: str, json_file_path: str = None) -> "ShardedStore":
+        """Open the store at dir_path, creating it from the JSON file it replaces (a dict) if the store does not exist yet"""
+        store = cls(dir_path)
+        if not store.exists() and json_file_path is not None and os.path.exists(json_file_path):
+            with open(json_file_path, "r") as file:
+                store.update(json.load(file))
+            store.save()
+        return store
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.dir_path, INDEX_FILE_NAME))
+
+    def get_saved_hash(self, key: str) -> str | None:
+        """Get the content hash of a key's value as last saved (None if never saved), without reading its shard"""
+        return self.shards[key]["hash"]
+
+    def load_shard(self, key: str):
+        """Read a key's value from its shard file, without keeping it in the store (e.g. to stream over large stores)"""
+        if key in self.loaded_values:
+            return self.loaded_values[key]
+        with gzip.open(os.path.join(self.dir_path, self.shards[key]["file"]), "rb") as file:
+            return json.loads(file.read())
+
+    def __getitem__(self, key: str):
+        if key not in self.loaded_values:
+            if key not in self.shards:
+                raise KeyError(key)
+            self.loaded_values[key] = self.load_shard(key)
+        return self.loaded_values[key]
+
+    def __setitem__(self, key: str, value):
+        if key not in self.shards:
+            self.shards[key] = {"file": get_shard_file_name(key), "hash": None}
+        self.loaded_values[key] = value
+
+    def __delitem__(self, key: str):
+        del self.shards[key]
+        self.loaded_values.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self.shards
+
+    def __iter__(self):
+        return iter(list(self.shards))
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def clear(self):
+        self.shards = {}
+        self.loaded_values = {}
+
+    def save(self):
+        """Write the shards of accessed keys whose content changed, remove shards of deleted keys, and write the index"""
+        os.makedirs(self.dir_path, exist_ok=True)
+        for key, value in self.loaded_values.items():
+            data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+            content_hash = hashlib.sha256(data).hexdigest()
+            if content_hash != self.shards[key]["hash"]:
+                write_file_atomically(os.path.join(self.dir_path, self.shards[key]["file"]), gzip.compress(data, mtime=0))
+                self.shards[key]["hash"] = content_hash
+
+        index = [{"key": key, **shard} for key, shard in self.shards.items()]
+        write_file_atomically(os.path.join(self.dir_path, INDEX_FILE_NAME), json.dumps(index, indent=0, ensure_ascii=False).encode())
+
+        shard_file_names = {shard["file"] for shard in self.shards.values()}
+        for file_name in os.listdir(self.dir_path):
+            if file_name.endswith(SHARD_FILE_SUFFIX) and file_name not in shard_file_names:
+                os.remove(os.path.join(self.dir_path, file_name))
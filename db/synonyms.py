@@ -7,7 +7,7 @@ import os
 import json
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
 
 load_dotenv()
 
@@ -15,20 +15,36 @@ uri = os.getenv("MONGODB_URI")
 client = MongoClient(uri)
 db = client["db"]
 
+changed = False
 for file in os.listdir("synonyms"):
     collection_name = f"synonymous_{os.path.splitext(file)[0]}"
     with open(os.path.join("synonyms", file), "r") as file:
         synonyms = json.load(file)
 
+    # Upsert all synonym mappings in one bulk write, then delete mappings no longer in the file
+    operations = []
+    _ids = []
     for key in synonyms:
         _id = key.replace(" ", "_").lower()
-        if db[collection_name].find_one({"_id": _id}):
-            print(f"Synonym mapping {_id} already in database, skipping")
-        else:
-            mapping_data = {
-                "mappingType": "equivalent",
-                "synonyms": synonyms[key],
-                "_id": _id
-            }
-            db[collection_name].insert_one(mapping_data)
-            print(f"Added synonym mapping {_id}")
+        _ids.append(_id)
+        mapping_data = {
+            "mappingType": "equivalent",
+            "synonyms": synonyms[key],
+            "_id": _id
+        }
+        operations.append(ReplaceOne(filter={"_id": _id}, replacement=mapping_data, upsert=True))
+    result = db[collection_name].bulk_write(operations, ordered=False) if operations else None
+    upserted_count = result.upserted_count if result else 0
+    modified_count = result.modified_count if result else 0
+    deleted_count = db[collection_name].delete_many({"_id": {"$nin": _ids}}).deleted_count
+    print(f"Synonym mappings in {collection_name}: {upserted_count} added, {modified_count} updated, {deleted_count} deleted")
+    changed = changed or bool(upserted_count or modified_count or deleted_count)
+
+# Bump synonyms version stamp if any mapping changed, so that API instances reload synonyms
+if changed:
+    db["metadata"].update_one(
+        filter={"_id": "synonyms_version"},
+        update={"$inc": {"version": 1}},
+        upsert=True
+    )
+    print("Bumped synonyms version")
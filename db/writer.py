@@ -4,14 +4,27 @@ Program that writes data on universities and courses to database
 """
 
 import os
+import sys
 import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, DeleteOne
+
+from course_data_reader import iter_course_data
 
 load_dotenv()
 
+# Number of course writes sent to the database per (unordered) bulk write
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "1000"))
+
+# Number of universities written concurrently, sharing the client's connection pool
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+
 with open("data_sources_config.yaml") as file:
     data_sources_config = yaml.load(file, Loader=yaml.FullLoader)
 
@@ -19,46 +32,137 @@ with open(os.path.join("..", "universities.json"), "r") as file:
     universities = json.load(file)
 
 uri = os.getenv("MONGODB_URI")
-client = MongoClient(uri)
+client = MongoClient(uri, maxPoolSize=max(INGEST_WORKERS, 1) * 2)
 db = client["db"]
 
-for university_id in os.listdir(os.path.join("..", "cache")):
-    # Add university to database
-    university_dir = os.path.join("..", "cache", university_id)
+# Number of course writes sent to the database by all universities, including universities that failed afterwards
+sent_write_count = 0
+sent_write_count_lock = threading.Lock()
+
+
+def write_courses(operations: list) -> int:
+    """Send course writes to the database in one unordered bulk write, returning the number of writes sent"""
+    global sent_write_count
+    if operations:
+        with sent_write_count_lock:
+            sent_write_count += len(operations)  # Counted before sending, since a failed bulk write may be partly applied
+        db["courses"].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def get_content_hash(course_data: dict) -> str:
+    """Get hash of a course document's content (all fields but content_hash), independent of field order"""
+    content = {key: value for key, value in course_data.items() if key != "content_hash"}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def write_university(university_id: str) -> dict:
+    """Write a university and its courses to the database, returning counts of courses added, changed, unchanged, and removed
+
+    Universities are independent of each other, so this runs concurrently for different universities
+    """
+    start_time = time.time()
 
+    # Add university to database
     university_data = universities[university_id]
     university_data["_id"] = university_id
 
     if db["universities"].find_one({"_id": university_id}):
-        print(f"University {university_id} already in database, skipping")
+        print(f"[{university_id}] University already in database, skipping")
     else:
         db["universities"].insert_one(university_data)
-        print(f"Added university {university_id}")
+        print(f"[{university_id}] Added university")
 
-    # Add university's courses to database
+    # Add university's courses to database, writing only the courses whose content differs from the database
+    # Content hashes of the courses already in the database are fetched once, and each course is compared by hash
+    # A course listed more than once is taken from its first listing, in the first source listing it (in
+    # data_sources_config.yaml order), since department course catalogs are scraped for the first listing of each number
     university_data_sources = data_sources_config[university_id]
     course_data_file_paths = [os.path.join("..", "cache", university_id, data_source, "course_data.json") for data_source in university_data_sources]
+    existing_content_hashes = {
+        course["_id"]: course.get("content_hash")
+        for course in db["courses"].find({"university_id": university_id}, {"content_hash": 1})
+    }
+    course_sources = {}  # Maps ID of each course seen in this run to its source
+    counts = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
     for i, course_data_file_path in enumerate(course_data_file_paths):
-        print(f"Processing course data from source {university_id}-{i}")
-        with open(course_data_file_path, "r") as file:
-            courses = json.load(file)
-
-        for department in courses:
-            for course_data in courses[department]:
-                course_data["university_id"] = university_id
-                course_data["department"] = department
-                course_data["src"] = i
-                course_id = "_".join(course_data["number"].replace("-", "_").lower().split(" "))
-                course_id = f"{university_id}-{course_id}"
-                course_data["_id"] = course_id
-
-                existing_course = db["courses"].find_one({"_id": course_id})
-                if existing_course and existing_course["src"] < i:
-                    print(f"Course {course_id} already in database from another source, skipping")
-                else:
-                    db["courses"].update_one(
-                        filter={"_id": course_id},
-                        update={"$set": course_data},
-                        upsert=True
-                    )
-                    print(f"Added/updated course {course_id}")
+        print(f"[{university_id}] Processing course data from source {university_id}-{i}")
+
+        # Courses are read from the file one at a time, so at most one batch of courses is held in memory
+        operations = []
+        for department, course_data in iter_course_data(course_data_file_path):
+            course_data["university_id"] = university_id
+            course_data["department"] = department
+            course_data["src"] = i
+            course_id = "_".join(course_data["number"].replace("-", "_").lower().split(" "))
+            course_id = f"{university_id}-{course_id}"
+            course_data["_id"] = course_id
+
+            if course_id in course_sources:
+                continue  # Course already listed in this or another source
+            course_sources[course_id] = i
+
+            course_data["content_hash"] = get_content_hash(course_data)
+            if course_id not in existing_content_hashes:
+                counts["added"] += 1
+            elif existing_content_hashes[course_id] != course_data["content_hash"]:
+                counts["changed"] += 1
+            else:
+                counts["unchanged"] += 1
+                continue
+            existing_content_hashes[course_id] = course_data["content_hash"]
+            operations.append(ReplaceOne(
+                filter={"_id": course_id},
+                replacement=course_data,
+                upsert=True
+            ))
+            if len(operations) >= BULK_WRITE_BATCH_SIZE:
+                write_courses(operations)
+                operations = []
+        write_courses(operations)
+
+    # Remove courses no longer listed in any source
+    removed_course_ids = [course_id for course_id in existing_content_hashes if course_id not in course_sources]
+    for j in range(0, len(removed_course_ids), BULK_WRITE_BATCH_SIZE):
+        write_courses([DeleteOne({"_id": course_id}) for course_id in removed_course_ids[j:j + BULK_WRITE_BATCH_SIZE]])
+    counts["removed"] = len(removed_course_ids)
+
+    elapsed_time = time.time() - start_time
+    print(f"[{university_id}] Courses: " + ", ".join(f"{count} {kind}" for kind, count in counts.items()) + f" in {elapsed_time:.2f} seconds")
+    return counts
+
+
+start_time = time.time()
+university_ids = os.listdir(os.path.join("..", "cache"))
+total_counts = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+failed_university_ids = []
+with ThreadPoolExecutor(max_workers=max(1, min(INGEST_WORKERS, len(university_ids)))) as executor:
+    futures = {university_id: executor.submit(write_university, university_id) for university_id in university_ids}
+    for university_id, future in futures.items():
+        try:
+            counts = future.result()
+        except Exception as e:
+            # Other universities are still written, and the data version is still bumped for their changes
+            print(f"[{university_id}] Exception raised while writing university: {e!r}")
+            failed_university_ids.append(university_id)
+            continue
+        for kind, count in counts.items():
+            total_counts[kind] += count
+
+elapsed_time = time.time() - start_time
+processed_count = sum(total_counts.values())
+print(f"Processed {processed_count} courses of {len(university_ids)} universities in {elapsed_time:.2f} seconds ({processed_count / max(elapsed_time, 1e-9):.0f} courses/s)")
+
+# Bump data version stamp if any course was written (even by a university that failed afterwards), so that API
+# instances drop cached responses and reload course data
+if sent_write_count:
+    db["metadata"].update_one(
+        filter={"_id": "data_version"},
+        update={"$inc": {"version": 1}},
+        upsert=True
+    )
+    print("Bumped data version")
+
+if failed_university_ids:
+    print(f"Failed to write {len(failed_university_ids)} universities: {', '.join(failed_university_ids)}")
+    sys.exit(1)
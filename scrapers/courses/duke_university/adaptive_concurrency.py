@@ -0,0 +1,174 @@
+"""adaptive_concurrency.py
+
+Adaptive concurrency and retries for the requests of a scraper to a server, so that a crawl runs as fast as the server
+allows without degrading data when the server throttles or fails transiently
+"""
+
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+
+# Status codes of responses that signal an overloaded server, and are retried
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_retry_after_sec(response) -> float | None:
+    """Get the time to wait before retrying from a response's Retry-After header (seconds or HTTP date), if any"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if not retry_after:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_backoff_sec(attempt: int, base_sec: float, max_sec: float) -> float:
+    """Get a jittered exponential backoff time for a retry ("full jitter": uniform up to base_sec * 2 ** attempt)"""
+    return random.uniform(0, min(max_sec, base_sec * 2 ** attempt))
+
+
+class AdaptiveConcurrency:
+    """AdaptiveConcurrency
+
+    Limit on the number of requests in flight to a server, adjusted by additive increase / multiplicative decrease:
+    the limit grows by about 1 per round of healthy responses (up to max_concurrency), and is multiplied by
+    decrease_factor (down to min_concurrency) on throttled or failed responses (429, 5xx, connection errors), or when
+    the smoothed latency rises above latency_tolerance times the lowest latency seen
+    Throttled requests are retried up to max_retries times after a jittered exponential backoff, or after the time
+    given by the server's Retry-After header, during which no request is sent to the server
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1, initial_concurrency: int = 1,
+                 latency_tolerance: float = 2.0, decrease_factor: float = 0.5,
+                 max_retries: int = 4, backoff_base_sec: float = 1.0, backoff_max_sec: float = 60.0):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = min(max(min_concurrency, 1), self.max_concurrency)
+        self.limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.paused_until = 0.0  # No request is sent before this time (e.g. as asked by the server's Retry-After header)
+        self.min_latency_sec = None
+        self.smoothed_latency_sec = None
+        self.last_decrease_time = 0.0
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "failed": 0, "decreases": 0, "max_limit": int(self.limit)}
+
+    @contextmanager
+    def slot(self):
+        """Wait until a request may be sent (fewer requests than the limit in flight, and not paused), holding a slot until the request is done"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def record(self, latency_sec: float, throttled: bool, retry_after_sec: float | None = None):
+        """Adjust the limit given the latency of a request and whether it was throttled or failed"""
+        with self.condition:
+            now = time.monotonic()
+            self.stats["requests"] += 1
+            if retry_after_sec:
+                self.paused_until = max(self.paused_until, now + retry_after_sec)
+            if throttled:
+                self.stats["throttled"] += 1
+                self.decrease(now)
+            else:
+                if self.min_latency_sec is None or latency_sec < self.min_latency_sec:
+                    self.min_latency_sec = latency_sec
+                if self.smoothed_latency_sec is None:
+                    self.smoothed_latency_sec = latency_sec
+                else:
+                    self.smoothed_latency_sec += 0.2 * (latency_sec - self.smoothed_latency_sec)
+                if self.smoothed_latency_sec > self.latency_tolerance * self.min_latency_sec:
+                    if self.limit > self.min_concurrency:
+                        self.decrease(now)
+                    else:
+                        # Slow even at the lowest concurrency, so the server itself is slower: take its latency as the new baseline
+                        self.min_latency_sec = self.smoothed_latency_sec
+                else:
+                    self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+                    self.stats["max_limit"] = max(self.stats["max_limit"], int(self.limit))
+            self.condition.notify_all()
+
+    def decrease(self, now: float):
+        # Decrease at most once per round trip, since the requests in flight when the server got overloaded all see it
+        if now - self.last_decrease_time < (self.smoothed_latency_sec or 0.0):
+            return
+        self.limit = max(self.limit * self.decrease_factor, self.min_concurrency)
+        self.last_decrease_time = now
+        self.stats["decreases"] += 1
+        if self.smoothed_latency_sec is not None and self.min_latency_sec is not None:
+            # Let the latency estimate settle at the lower concurrency instead of decreasing again on stale samples
+            self.smoothed_latency_sec = min(self.smoothed_latency_sec, self.latency_tolerance * self.min_latency_sec)
+
+    def request(self, send, wait=None):
+        """Send a request with send() (returning a response) once a slot is free, retrying it while it is throttled or fails
+
+        Args:
+            send: Function sending the request and returning its response, with a timeout (a request that hangs holds
+                its slot and gives no latency or error signal until it times out)
+            wait: Function called once a slot is free, before each attempt is sent (e.g. to keep a delay between
+                requests), whose time does not count in the request's latency
+
+        Returns:
+            The response, which is the last throttled response if all retries are throttled
+
+        Raises:
+            The exception of the last attempt, if all attempts fail with an exception (e.g. connection error)
+        """
+        for attempt in range(self.max_retries + 1):
+            response, exception = None, None
+            with self.slot():
+                if wait is not None:
+                    wait()
+                start_time = time.monotonic()
+                try:
+                    response = send()
+                except OSError as e:  # Connection errors and timeouts (requests' exceptions are OSErrors)
+                    exception = e
+                latency_sec = time.monotonic() - start_time
+            throttled = exception is not None or response.status_code in RETRY_STATUS_CODES
+            retry_after_sec = get_retry_after_sec(response) if throttled else None
+            self.record(latency_sec, throttled, retry_after_sec)
+            if not throttled:
+                return response
+            if attempt == self.max_retries:
+                break
+            with self.condition:
+                self.stats["retries"] += 1
+            time.sleep(max(retry_after_sec or 0.0, get_backoff_sec(attempt, self.backoff_base_sec, self.backoff_max_sec)))
+
+        with self.condition:
+            self.stats["failed"] += 1
+        if exception is not None:
+            raise exception
+        return response
+
+    def get_stats_summary(self) -> str:
+        stats = self.stats
+        return (f"{stats['requests']} requests, {stats['throttled']} throttled or failed, {stats['retries']} retried, "
+                f"{stats['failed']} failed after retries, concurrency limit {int(self.limit)} (max {stats['max_limit']}, "
+                f"{stats['decreases']} decreases)")
@@ -0,0 +1,136 @@
+"""adaptive_concurrency.py
+
+Program that checks and benchmarks the adaptive concurrency and retries of the scrapers against a local stub server that
+throttles
+
+The stub server serves requests with a latency that rises once more than --capacity requests are in flight, answers
+429 Too Many Requests (with Retry-After) once more than twice that many are in flight, and fails a --failure-rate
+fraction of requests with 503. The same requests are sent with a fixed number of requests in flight and no retries
+(the previous behavior), and with AdaptiveConcurrency, comparing time and responses lost to throttling
+The program exits with an error if any request still fails with AdaptiveConcurrency
+
+Usage (from the scrapers/courses/duke_university directory):
+    python benchmarks/adaptive_concurrency.py [--requests N] [--concurrency N] [--capacity N] [--failure-rate F]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from adaptive_concurrency import AdaptiveConcurrency  # noqa: E402
+
+BASE_LATENCY_SEC = 0.02
+RETRY_AFTER_SEC = 0.2
+REQUEST_TIMEOUT_SEC = (5, 5)
+
+
+class ThrottlingServer(ThreadingHTTPServer):
+    """ThrottlingServer
+
+    Stub server whose latency rises with the requests in flight above its capacity, and that throttles requests beyond
+    twice its capacity and fails a fraction of requests
+    """
+
+    daemon_threads = True
+    request_queue_size = 128  # Connections from all client threads are accepted without SYN retransmits
+
+    def __init__(self, capacity: int, failure_rate: float):
+        super().__init__(("127.0.0.1", 0), ThrottlingRequestHandler)
+        self.capacity = capacity
+        self.failure_rate = failure_rate
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class ThrottlingRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            in_flight = server.in_flight
+        try:
+            if in_flight > 2 * server.capacity:
+                self.respond(429, {"Retry-After": str(RETRY_AFTER_SEC)})
+            elif random.random() < server.failure_rate:
+                self.respond(503)
+            else:
+                time.sleep(BASE_LATENCY_SEC * max(1, in_flight / server.capacity) ** 2)
+                self.respond(200)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def respond(self, status_code: int, headers: dict = None):
+        body = f'{{"status": {status_code}}}'.encode()
+        self.send_response(status_code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(url: str, request_count: int, concurrency: int, adaptive_concurrency: AdaptiveConcurrency | None) -> tuple[float, dict]:
+    """Send request_count requests to url from concurrency threads, returning the time taken and the count of each status code"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+
+    def send(i: int) -> int:
+        if adaptive_concurrency is None:
+            return session.get(f"{url}/{i}", timeout=REQUEST_TIMEOUT_SEC).status_code
+        return adaptive_concurrency.request(lambda: session.get(f"{url}/{i}", timeout=REQUEST_TIMEOUT_SEC)).status_code
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        status_codes = list(executor.map(send, range(request_count)))
+    elapsed_sec = time.perf_counter() - start_time
+    return elapsed_sec, {status_code: status_codes.count(status_code) for status_code in sorted(set(status_codes))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark adaptive concurrency against a throttling stub server")
+    parser.add_argument("--requests", type=int, default=1000, help="Number of requests sent in each run")
+    parser.add_argument("--concurrency", type=int, default=32, help="Number of threads sending requests (maximum concurrency)")
+    parser.add_argument("--capacity", type=int, default=4, help="Number of requests in flight the stub server serves without slowing down")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="Fraction of requests failed by the stub server with 503")
+    args = parser.parse_args()
+
+    random.seed(0)
+    server = ThrottlingServer(args.capacity, args.failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    elapsed_sec, status_codes = run(url, args.requests, args.concurrency, None)
+    print(f"Fixed concurrency {args.concurrency}, no retries: {args.requests / elapsed_sec:.0f} requests/s, "
+          f"responses by status code {status_codes}, at most {server.max_in_flight} requests in flight")
+
+    server.max_in_flight = 0
+    adaptive_concurrency = AdaptiveConcurrency(args.concurrency, backoff_base_sec=0.05, backoff_max_sec=1)
+    elapsed_sec, status_codes = run(url, args.requests, args.concurrency, adaptive_concurrency)
+    print(f"Adaptive concurrency up to {args.concurrency}: {args.requests / elapsed_sec:.0f} requests/s, "
+          f"responses by status code {status_codes}, at most {server.max_in_flight} requests in flight")
+    print(adaptive_concurrency.get_stats_summary())
+
+    server.shutdown()
+    if set(status_codes) != {200}:
+        print("Requests failed with adaptive concurrency")
+        sys.exit(1)
@@ -0,0 +1,91 @@
+"""cross_listing.py
+
+Program that benchmarks linking of cross-listed courses on a synthetic Curriculum API catalog
+
+The catalog has --courses course offerings (100,000 by default), a fraction of them cross-listed in groups of 2 to
+4 offerings sharing a crse_id. The linker is checked against the previous linker, which went over every lower
+crse_offer_nbr of each course through the crse_id/crse_offer_nbr to course number and index mapping, and both are timed
+
+Usage (from the scrapers/courses/duke_university directory):
+    python benchmarks/cross_listing.py [--courses N] [--cross-listed-fraction F]
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cross_listing import link_cross_listed_courses  # noqa: E402
+
+
+def make_course_data(course_count: int, cross_listed_fraction: float, rng: random.Random) -> dict:
+    """Make course data (subject -> list of courses), with offerings of cross-listed courses in different subjects"""
+    subjects = [f"SUBJ{i}" for i in range(200)]
+    course_data = {subject: [] for subject in subjects}
+    crse_id = 0
+    count = 0
+    while count < course_count:
+        crse_id += 1
+        offering_count = rng.randint(2, 4) if rng.random() < cross_listed_fraction else 1
+        for crse_offer_nbr, subject in enumerate(rng.sample(subjects, offering_count), start=1):
+            course_data[subject].append({
+                "number": f"{subject} {crse_id % 1000 + 1}",
+                "crse_id": f"{crse_id:06d}",
+                "crse_offer_nbr": str(crse_offer_nbr),
+                "cross_listed_as": []
+            })
+            count += 1
+    return course_data
+
+
+def link_cross_listed_courses_by_offer_nbr(course_data: dict):
+    """Previous linker, kept as the reference for equivalence"""
+    mapping = {}
+    for subject_courses in course_data.values():
+        for i, course in enumerate(subject_courses):
+            mapping[f"{course['crse_id']}-{course['crse_offer_nbr']}"] = (course["number"], i)
+
+    for course in [course for subject_courses in course_data.values() for course in subject_courses]:
+        crse_id = course["crse_id"]
+        crse_offer_nbr = int(course["crse_offer_nbr"])
+        for i in range(1, crse_offer_nbr):
+            if f"{crse_id}-{i}" in mapping:
+                cross_listed_course_number, index = mapping[f"{crse_id}-{i}"]
+                subject = cross_listed_course_number.split(" ")[0]
+                course_data[subject][index]["cross_listed_as"].append(course["number"])
+                course_data[subject][index]["cross_listed_as"] = list(set(course_data[subject][index]["cross_listed_as"]))
+                course["cross_listed_as"].append(cross_listed_course_number)
+                course["cross_listed_as"] = list(set(course["cross_listed_as"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark linking of cross-listed courses")
+    parser.add_argument("--courses", type=int, default=100000)
+    parser.add_argument("--cross-listed-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    course_data = make_course_data(args.courses, args.cross_listed_fraction, random.Random(args.seed))
+    reference_course_data = copy.deepcopy(course_data)
+
+    start_time = time.perf_counter()
+    link_cross_listed_courses(course_data)
+    elapsed_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    link_cross_listed_courses_by_offer_nbr(reference_course_data)
+    reference_elapsed_time = time.perf_counter() - start_time
+
+    courses = [course for subject_courses in course_data.values() for course in subject_courses]
+    reference_courses = [course for subject_courses in reference_course_data.values() for course in subject_courses]
+    mismatches = sum(set(course["cross_listed_as"]) != set(reference_course["cross_listed_as"]) for course, reference_course in zip(courses, reference_courses))
+    print(f"{len(courses)} courses, {sum(bool(course['cross_listed_as']) for course in courses)} cross-listed")
+    print(f"Linker: {elapsed_time * 1000:.1f} ms ({len(courses) / elapsed_time:.0f} courses/s)")
+    print(f"Previous linker: {reference_elapsed_time * 1000:.1f} ms ({len(courses) / reference_elapsed_time:.0f} courses/s)")
+    print(f"Courses whose cross-listings differ from previous linker: {mismatches}")
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""html_parsing.py
+
+Program that checks and benchmarks extraction of course data from the saved HTML fixtures of each page layout
+
+The extraction in html_parsing.py (which parses only the relevant part of each page, with lxml if installed) is
+checked against the previous extraction (full page parsed with html.parser) on every fixture, and both are timed
+in pages per second. The program exits with an error if any fixture's extracted data differs
+
+Usage (from the scrapers/courses/duke_university directory):
+    python benchmarks/html_parsing.py [--repeat N]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from html_parsing import PARSER, parse_course_catalog, parse_course_page  # noqa: E402
+
+FIXTURES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "fixtures"))
+COURSE_CATALOG_URL = "https://cs.duke.edu/courses"
+VALID_CURRICULUM_CODES = ["ALP", "CZ", "NS", "QS", "SS", "CCI", "EI", "FL", "R", "STS", "W", "CE", "HI", "IJ", "NW", "QC", "SB"]
+
+# Fixtures of each page layout, with whether the courses are listed in the second table for course catalog pages
+COURSE_CATALOG_FIXTURES = {"course_catalog.html": False, "course_catalog_skip_first_table.html": True}
+COURSE_PAGE_FIXTURES = ["course_page.html", "course_page_labs_ctrs_content.html", "course_page_no_description.html"]
+
+
+def parse_course_catalog_reference(content: bytes, course_catalog_url: str, valid_curriculum_codes: list, skip_first_table: bool = False) -> list[dict]:
+    """Previous extraction from DepartmentCourseCatalogsScraper.get_course_data"""
+    courses = []
+    soup = BeautifulSoup(content, "html.parser")
+    if skip_first_table:
+        table = soup.select("table.tablesaw")[1]
+    else:
+        table = soup.select_one("table.tablesaw")
+    for tr in table.select("tbody tr"):
+        number = re.sub(" +", " ", tr.select("td")[0].text.strip())
+        title = re.sub(" +", " ", tr.select("td")[1].text.strip())
+        url = tr.select("td")[1].select_one("a")
+        if url:
+            url = url["href"]
+            url = urljoin(course_catalog_url, url)
+        codes = tr.select("td")[2].text.split(", ")
+        codes = [code.strip() for code in codes if code.strip() in valid_curriculum_codes]
+        courses.append({"title": title, "number": number, "codes": codes, "url": url})
+    return courses
+
+
+def parse_course_page_reference(content: bytes) -> dict:
+    """Previous extraction from DepartmentCourseCatalogsScraper.get_course_description"""
+    soup = BeautifulSoup(content, "html.parser")
+
+    section_section = soup.select_one("div#main div#content section.section")
+    div = section_section.select_one("section > div#block-tts-sub-content")
+    if div is None:
+        div = section_section.select_one("div#block-tts-labs-ctrs-content")
+    left_div, right_div = div.select("div.content > div > div")
+
+    description_divs = left_div.find_all("div", recursive=False)
+    if description_divs:
+        description = "\n".join([description_div.text for description_div in description_divs])
+    else:
+        description = None
+
+    prerequisites = None
+    prerequisites_label = left_div.find("h4", string="Prerequisites")
+    if prerequisites_label is not None:
+        prerequisites = prerequisites_label.find_next_sibling().text.strip()
+
+    typically_offered_label = right_div.find("h5", string="Typically Offered", recursive=False)
+    typically_offered = None
+    if typically_offered_label is not None:
+        typically_offered = typically_offered_label.find_next_sibling(string=True).strip()
+
+    cross_listed_as = []
+    for div in right_div.select("div.field"):
+        label = div.select_one("h5")
+        if label is not None:
+            label = label.text
+            lis = div.select("ul > li")
+            if label == "Cross-Listed As":
+                cross_listed_as = [li.text.strip() for li in lis]
+
+    return {"description": description, "prerequisites": prerequisites, "typically_offered": typically_offered, "cross_listed_as": cross_listed_as}
+
+
+def read_fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, file_name), "rb") as file:
+        return file.read()
+
+
+def get_pages_per_sec(function, pages: list, repeat: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            function(page)
+    return repeat * len(pages) / (time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark extraction of course data from HTML fixtures")
+    parser.add_argument("--repeat", type=int, default=200, help="Number of times each fixture is parsed when timing")
+    args = parser.parse_args()
+
+    mismatches = 0
+    catalog_pages = []
+    for file_name, skip_first_table in COURSE_CATALOG_FIXTURES.items():
+        content = read_fixture(file_name)
+        catalog_pages.append((content, skip_first_table))
+        if parse_course_catalog(content, COURSE_CATALOG_URL, VALID_CURRICULUM_CODES, skip_first_table) != parse_course_catalog_reference(content, COURSE_CATALOG_URL, VALID_CURRICULUM_CODES, skip_first_table):
+            print(f"Mismatch: {file_name}")
+            mismatches += 1
+    course_pages = []
+    for file_name in COURSE_PAGE_FIXTURES:
+        content = read_fixture(file_name)
+        course_pages.append(content)
+        if parse_course_page(content) != parse_course_page_reference(content):
+            print(f"Mismatch: {file_name}")
+            mismatches += 1
+    print(f"{len(COURSE_CATALOG_FIXTURES) + len(COURSE_PAGE_FIXTURES) - mismatches} of {len(COURSE_CATALOG_FIXTURES) + len(COURSE_PAGE_FIXTURES)} fixtures extracted identically (parser: {PARSER})")
+
+    for name, function, reference_function, pages in [
+        ("Course catalog pages", lambda page: parse_course_catalog(page[0], COURSE_CATALOG_URL, VALID_CURRICULUM_CODES, page[1]),
+         lambda page: parse_course_catalog_reference(page[0], COURSE_CATALOG_URL, VALID_CURRICULUM_CODES, page[1]), catalog_pages),
+        ("Course pages", parse_course_page, parse_course_page_reference, course_pages)
+    ]:
+        pages_per_sec = get_pages_per_sec(function, pages, args.repeat)
+        reference_pages_per_sec = get_pages_per_sec(reference_function, pages, args.repeat)
+        print(f"{name}: {pages_per_sec:.0f} pages/s (previously {reference_pages_per_sec:.0f} pages/s, {pages_per_sec / reference_pages_per_sec:.1f}x)")
+
+    if mismatches:
+        sys.exit(1)
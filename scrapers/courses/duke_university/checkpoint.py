@@ -0,0 +1,104 @@
+"""checkpoint.py
+
+Crash-safe checkpointing of scraper progress with an append-only journal
+"""
+
+import os
+import json
+
+
+def write_json_atomically(file_path: str, data, indent: int = 2):
+    """Write data as JSON to a file so that a crash leaves either the old or the new file, never a partial one"""
+    temp_file_path = f"{file_path}.tmp"
+    with open(temp_file_path, "w") as file:
+        json.dump(data, file, indent=indent)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file_path, file_path)
+
+
+class CheckpointJournal:
+    """CheckpointJournal
+
+    Set of completed keys (e.g. courses with fetched data) whose records are appended to a journal file as they complete
+
+    Each record is a JSON line holding a key and the data fetched for it. Records are flushed to the OS as they are
+    appended, so they survive the process crashing or being interrupted, and fsynced every fsync_every records, so
+    they also survive the machine crashing. The scraper compacts the journal by saving its full state and then
+    truncating the journal, so on restart it loads its saved state and replays only the records appended since
+    """
+
+    def __init__(self, file_path: str, completed_keys: list = (), fsync_every: int = 100):
+        self.file_path = file_path
+        self.completed_keys = set(completed_keys)
+        self.fsync_every = fsync_every
+        self.file = None
+        self.unsynced_count = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.completed_keys
+
+    def __len__(self) -> int:
+        return len(self.completed_keys)
+
+    def replay(self):
+        """Yield (key, data) records appended since the last compaction whose keys are not already completed
+
+        A partially written last record (from a crash mid-write) is dropped, so that appends continue from a whole record
+        """
+        if not os.path.exists(self.file_path):
+            return
+        valid_length = 0
+        records = []
+        with open(self.file_path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_length += len(line)
+                records.append(record)
+        if valid_length < os.path.getsize(self.file_path):
+            with open(self.file_path, "r+b") as file:
+                file.truncate(valid_length)
+
+        for record in records:
+            if record["key"] not in self.completed_keys:  # Already completed if the crash came between saving state and truncating the journal
+                self.completed_keys.add(record["key"])
+                yield record["key"], record["data"]
+
+    def append(self, key: str, data=None):
+        """Mark a key as completed, appending its record to the journal"""
+        if self.file is None:
+            self.file = open(self.file_path, "a")
+        self.file.write(json.dumps({"key": key, "data": data}) + "\n")
+        self.file.flush()
+        self.completed_keys.add(key)
+        self.unsynced_count += 1
+        if self.unsynced_count >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """Force appended records to disk"""
+        if self.file is not None and self.unsynced_count:
+            os.fsync(self.file.fileno())
+        self.unsynced_count = 0
+
+    def truncate(self):
+        """Empty the journal once the scraper's state including all its records has been saved"""
+        self.close()
+        with open(self.file_path, "w") as file:
+            os.fsync(file.fileno())
+
+    def restart(self):
+        """Forget all completed keys (e.g. to refetch every key on a refresh), once the scraper's state has been saved"""
+        self.truncate()
+        self.completed_keys = set()
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
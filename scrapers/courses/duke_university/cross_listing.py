@@ -0,0 +1,70 @@
+"""cross_listing.py
+
+Linking of cross-listed courses in Curriculum API course data
+"""
+
+import re
+
+
+def normalize_course_number(course_number: str) -> str:
+    """Collapse whitespace in a course number, e.g. "COMPSCI  201 " -> "COMPSCI 201", so that numbers from different sources compare equal"""
+    return re.sub(r"\s+", " ", course_number.strip())
+
+
+def merge_unique(*lists: list) -> list:
+    """Concatenate lists, keeping only the first occurrence of each item"""
+    merged = {}
+    for items in lists:
+        merged.update(dict.fromkeys(items))
+    return list(merged)
+
+
+def get_html_cross_listings(html_course_data: dict) -> dict:
+    """Get a dict mapping course numbers to the cross_listed_as lists scraped from department course catalog pages
+
+    Args:
+        html_course_data: Course data of the department course catalogs scraper (department name -> list of course data)
+    """
+    cross_listings = {}
+    for department_courses in html_course_data.values():
+        for course in department_courses:
+            if course.get("cross_listed_as"):
+                course_number = normalize_course_number(course["number"])
+                cross_listings[course_number] = merge_unique(
+                    cross_listings.get(course_number, []),
+                    [normalize_course_number(number) for number in course["cross_listed_as"]]
+                )
+    return cross_listings
+
+
+def link_cross_listed_courses(course_data: dict, html_cross_listings: dict = None):
+    """Link cross-listed courses, setting each course's cross_listed_as list in place
+
+    Course listings with the same crse_id but different crse_offer_nbr values are the same course cross-listed with
+    different numbers, so courses are grouped by crse_id in one pass and each course gets the numbers of its group's
+    other courses, in course data order
+    Entries already in a course's cross_listed_as list (e.g. from a previous run) come first and are kept, followed by
+    the peers and then by any cross-listings scraped from department course catalog pages (html_cross_listings)
+
+    Args:
+        course_data: Course data (subject -> list of course data with crse_id, number, and cross_listed_as)
+        html_cross_listings: Dict mapping course numbers to cross-listed course numbers (see get_html_cross_listings)
+    """
+    html_cross_listings = html_cross_listings or {}
+
+    groups = {}
+    for subject_courses in course_data.values():
+        for course in subject_courses:
+            groups.setdefault(course["crse_id"], []).append(course)
+
+    for group in groups.values():
+        group_numbers = [course["number"] for course in group] if len(group) > 1 else []
+        for course in group:
+            html_numbers = html_cross_listings.get(normalize_course_number(course["number"]), []) if html_cross_listings else []
+            if not group_numbers and not html_numbers:
+                continue  # Not cross-listed
+            course["cross_listed_as"] = [
+                number
+                for number in merge_unique(course["cross_listed_as"], group_numbers, html_numbers)
+                if number != course["number"]
+            ]
@@ -4,13 +4,31 @@ Program that downloads data about Duke University courses from Duke University's
 """
 
 from os import path, makedirs, listdir, getenv
+import sys
+import argparse
 import json
 import time
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from checkpoint import CheckpointJournal, write_json_atomically
+from cross_listing import get_html_cross_listings, link_cross_listed_courses, merge_unique
+from curriculum_api_parsing import parse_course_offering
+from http_cache import HTTPCache
+from pipeline import Pipeline
+from rate_limiter import RateLimiter
+from adaptive_concurrency import AdaptiveConcurrency, RETRY_STATUS_CODES
+
+# The sharded cache format is shared with the database writer, which reads it
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..", "..", "db")))
+from sharded_store import ShardedStore, get_shards_path  # noqa: E402
+
 load_dotenv()
 
 with open("config.yaml") as file:
@@ -23,9 +41,37 @@ CACHE_DIR = path.abspath(path.join(
 ))
 makedirs(CACHE_DIR, exist_ok=True)
 
+# HTTP cache shared by the scrapers of the university
+HTTP_CACHE_DIR = path.join(path.dirname(CACHE_DIR), "http_cache")
+
+# Course data of the department course catalogs scraper, whose cross-listings are merged into the downloaded course data
+HTML_COURSE_DATA_FILE_PATH = path.join(path.dirname(CACHE_DIR), "department_course_catalogs_scraper", "course_data.json")
+
 API_KEY = getenv("DUKE_UNIVERSITY_CURRICULUM_API_KEY")
 BASE_URL = "https://streamer.oit.duke.edu/curriculum"
 
+# Maximum number of requests in flight at once (1 downloads serially) and maximum request rate across all of them
+CONCURRENCY = config.get("curriculum_api_concurrency", 1)
+REQUESTS_PER_SEC = config.get("curriculum_api_requests_per_sec", 0)
+
+# Time to wait for a connection and for the server to send data before a request fails (and is retried)
+REQUEST_TIMEOUT_SEC = (config.get("request_timeout_sec", {}).get("connect", 10), config.get("request_timeout_sec", {}).get("read", 60))
+
+# Adjustment of the number of requests in flight (up to CONCURRENCY) and retries of throttled requests (see AdaptiveConcurrency)
+ADAPTIVE_CONCURRENCY_OPTIONS = config.get("adaptive_concurrency", {})
+
+# Number of processes parsing fetched data (0 for one per core) and number of fetched items waiting to be parsed
+# before fetching pauses
+PARSE_WORKERS = config.get("parse_workers", 0)
+PIPELINE_MAX_PENDING = config.get("pipeline_max_pending", 64)
+
+# Number of courses fetched between fsyncs of the checkpoint journal and between saves of the full state (compactions)
+CHECKPOINT_FSYNC_EVERY = config.get("checkpoint_fsync_every", 100)
+CHECKPOINT_COMPACT_EVERY = config.get("checkpoint_compact_every", 1000)
+
+# Time for which cached responses are used without revalidation
+HTTP_CACHE_TTL_SEC = config.get("http_cache_ttl_sec", {}).get("curriculum_api", 0)
+
 valid_curriculum_codes = [code for code_list in config.get("curriculum_codes").values() for code in code_list]
 
 
@@ -35,30 +81,84 @@ class CurriculumAPIDataDownloader:
     Data downloader class that fetches data about Duke University courses from the university's Curriculum API
     """
 
-    def __init__(self):
+    def __init__(self, refresh: bool = False):
+        """
+        Args:
+            refresh: Whether to refetch everything (through the HTTP cache, so unchanged responses are not downloaded again)
+                Previously downloaded data is kept and replaced as it is refetched, so that a refresh spanning several
+                runs never leaves courses without data in the meantime
+        """
         self.init_time = time.time()
+        self.refresh = refresh
+        self.http_cache = HTTPCache(HTTP_CACHE_DIR, HTTP_CACHE_TTL_SEC)
 
+        # Course lists and course data are sharded by subject, and shards are only read when their subject is accessed
+        # (created from course_list.json and course_data.json, if sharded stores do not exist yet)
         self.subjects = []
-        self.course_list = {}
-        self.course_data = {}
+        self.course_list = ShardedStore.open(path.join(CACHE_DIR, "course_list.shards"), path.join(CACHE_DIR, "course_list.json"))
+        self.course_data = ShardedStore.open(path.join(CACHE_DIR, "course_data.shards"), path.join(CACHE_DIR, "course_data.json"))
         if "subjects.json" in listdir(CACHE_DIR):
             with open(path.join(CACHE_DIR, "subjects.json"), "r") as file:
                 self.subjects = json.load(file)
-        if "course_list.json" in listdir(CACHE_DIR):
-            with open(path.join(CACHE_DIR, "course_list.json"), "r") as file:
-                self.course_list = json.load(file)
-        if "course_data.json" in listdir(CACHE_DIR):
-            with open(path.join(CACHE_DIR, "course_data.json"), "r") as file:
-                self.course_data = json.load(file)
 
         self.courses_with_data = []
-        self.crse_id_offer_nbr_and_course_number_mapping = {}
         if "courses_with_data.json" in listdir(CACHE_DIR):
             with open(path.join(CACHE_DIR, "courses_with_data.json"), "r") as file:
                 self.courses_with_data = json.load(file)
-        if "crse_id_offer_nbr_and_course_number_mapping.json" in listdir(CACHE_DIR):
-            with open(path.join(CACHE_DIR, "crse_id_offer_nbr_and_course_number_mapping.json"), "r") as file:
-                self.crse_id_offer_nbr_and_course_number_mapping = json.load(file)
+
+        # Subjects whose course data changed since cross-listed courses were last linked (None if all need linking),
+        # the subjects with courses of each crse_id (so that linking reads only the shards of cross-listed peers), and
+        # cross-listings scraped from department course catalog pages with a fingerprint of the data they came from
+        self.unlinked_subjects = None
+        self.crse_id_subjects = {}
+        self.html_fingerprint = None
+        self.html_cross_listings = {}
+        if "cross_listing_index.json" in listdir(CACHE_DIR):
+            with open(path.join(CACHE_DIR, "cross_listing_index.json"), "r") as file:
+                cross_listing_index = json.load(file)
+            self.unlinked_subjects = cross_listing_index["unlinked_subjects"]
+            self.crse_id_subjects = cross_listing_index["crse_id_subjects"]
+            self.html_fingerprint = cross_listing_index["html_fingerprint"]
+            self.html_cross_listings = cross_listing_index["html_cross_listings"]
+
+        # Recover courses fetched after the state was last saved (e.g. before a crash) from the checkpoint journal
+        self.checkpoint = CheckpointJournal(path.join(CACHE_DIR, "course_data_journal.jsonl"), self.courses_with_data, CHECKPOINT_FSYNC_EVERY)
+        for course_key, record in self.checkpoint.replay():
+            self.add_course_data(course_key, record["subject"], record["course_data"])
+
+        # Keys of the courses of each subject's course list not fetched yet, with the content hash of the course list
+        # they were taken from, so that finding courses to fetch reads only the course lists of subjects with such courses,
+        # and whether course lists were refetched (by a refresh) since courses no longer listed were last removed
+        self.unfetched_courses = {}
+        self.remove_unlisted_courses = False
+        if "fetch_index.json" in listdir(CACHE_DIR):
+            with open(path.join(CACHE_DIR, "fetch_index.json"), "r") as file:
+                fetch_index = json.load(file)
+            self.unfetched_courses = fetch_index["unfetched_courses"]
+            self.remove_unlisted_courses = fetch_index["remove_unlisted_courses"]
+
+        if refresh:
+            # Save the recovered state, then forget which courses have been fetched, keeping their data
+            self.save()
+            self.courses_with_data = []
+            self.checkpoint.restart()
+            self.unfetched_courses = {}
+            self.remove_unlisted_courses = True
+
+        # Entries whose course list changed since they were saved (e.g. by a crash in between) are rebuilt from the
+        # course list, and so are all entries after a refresh
+        self.unfetched_courses = {
+            subject: self.unfetched_courses[subject]
+            if subject in self.unfetched_courses and self.unfetched_courses[subject]["hash"] == self.course_list.get_saved_hash(subject)
+            else {"hash": self.course_list.get_saved_hash(subject), "courses": self.get_unfetched_courses(self.course_list[subject])}
+            for subject in self.course_list
+        }
+
+        # Requests share keep-alive connections (one per concurrent request), a rate limit, and an adaptive concurrency limit
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(CONCURRENCY, 1)))
+        self.rate_limiter = RateLimiter(REQUESTS_PER_SEC)
+        self.concurrency = AdaptiveConcurrency(CONCURRENCY, **ADAPTIVE_CONCURRENCY_OPTIONS)
 
     def run(self):
         """
@@ -67,186 +167,292 @@ class CurriculumAPIDataDownloader:
         3. Get detailed data of each course
         4. Link cross-listed courses
         """
-        if not self.subjects:
+        if not self.subjects or self.refresh:
             self.get_subjects()
 
-        for subject in self.subjects:
-            if subject["code"] not in self.course_list:
-                self.get_course_list(subject)
+        self.get_course_lists([subject for subject in self.subjects if self.refresh or subject["code"] not in self.course_list])
 
         try:
             self.get_batch_of_course_data(config.get("curriculum_api_data_downloader_batch_size"))
         except Exception as e:
             print(f"Exception raised: {e}")
 
-        if not self.crse_id_offer_nbr_and_course_number_mapping:
-            self.link_crse_id_and_crse_offer_nbr_with_course_number_and_index()
-
         self.link_cross_listed_courses()
 
-        with open(path.join(CACHE_DIR, "subjects.json"), "w") as file:
-            json.dump(self.subjects, file, indent=2)
-        with open(path.join(CACHE_DIR, "course_list.json"), "w") as file:
-            json.dump(self.course_list, file, indent=2)
-        with open(path.join(CACHE_DIR, "course_data.json"), "w") as file:
-            json.dump(self.course_data, file, indent=2)
-        with open(path.join(CACHE_DIR, "courses_with_data.json"), "w") as file:
-            json.dump(self.courses_with_data, file, indent=2)
-        with open(path.join(CACHE_DIR, "crse_id_offer_nbr_and_course_number_mapping.json"), "w") as file:
-            json.dump(self.crse_id_offer_nbr_and_course_number_mapping, file, indent=2)
+        self.save()
+        print(self.http_cache.get_stats_summary())
+        print(f"Curriculum API requests: {self.concurrency.get_stats_summary()}")
+
+    def save(self):
+        """Save state, then compact the checkpoint journal, whose records the saved state now includes"""
+        write_json_atomically(path.join(CACHE_DIR, "subjects.json"), self.subjects)
+        self.course_list.save()
+        for subject, unfetched_courses in self.unfetched_courses.items():
+            unfetched_courses["hash"] = self.course_list.get_saved_hash(subject)
+        write_json_atomically(path.join(CACHE_DIR, "fetch_index.json"), {
+            "unfetched_courses": self.unfetched_courses,
+            "remove_unlisted_courses": self.remove_unlisted_courses
+        }, indent=0)
+        self.course_data.save()
+        # Saved after course data, so that a crash in between relinks subjects again rather than never (subjects changed
+        # since the journal was last truncated are marked as unlinked again when it is replayed)
+        write_json_atomically(path.join(CACHE_DIR, "cross_listing_index.json"), {
+            "unlinked_subjects": self.unlinked_subjects,
+            "crse_id_subjects": self.crse_id_subjects,
+            "html_fingerprint": self.html_fingerprint,
+            "html_cross_listings": self.html_cross_listings
+        }, indent=0)
+        # Courses are marked as fetched only once their data is saved, so that a crash in between never loses their data
+        write_json_atomically(path.join(CACHE_DIR, "courses_with_data.json"), self.courses_with_data)
+        self.checkpoint.truncate()
 
     def get_elapsed_time(self):
         return time.time() - self.init_time
 
+    def get(self, url: str) -> requests.Response:
+        """Get a response from the Curriculum API, through the HTTP cache"""
+        return self.http_cache.get(url, self.send)
+
+    def send(self, url: str, headers: dict) -> requests.Response:
+        """Send a GET request to the Curriculum API once the concurrency and rate limits allow, retrying it while the API throttles or fails"""
+        return self.concurrency.request(lambda: self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT_SEC), self.rate_limiter.acquire)
+
+    def map_concurrently(self, function, items: list, max_pending: int = None):
+        """Yield results of calling function on each item, running up to CONCURRENCY calls at once
+
+        Results are yielded in the order of items, so that results are processed in the same order as in a serial run
+        If max_pending is given, calls stop being started while max_pending results wait to be consumed
+        """
+        executor = ThreadPoolExecutor(max_workers=max(CONCURRENCY, 1))
+        futures = deque()
+        try:
+            for item in items:
+                futures.append(executor.submit(function, item))
+                if max_pending is not None and len(futures) >= max(CONCURRENCY, 1) + max_pending:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
     def get_subjects(self):
         """Get list of subjects"""
         print("Getting subjects")
 
         url = f"{BASE_URL}/list_of_values/fieldname/SUBJECT?access_token={API_KEY}"
-        response = requests.get(url)
+        response = self.get(url)
         data = response.json()
 
         self.subjects = data["scc_lov_resp"]["lovs"]["lov"]["values"]["value"]
 
-    def get_course_list(self, subject: dict):
-        """Get list of courses in the given subject"""
+    def get_course_lists(self, subjects: list):
+        """Get lists of courses in the given subjects concurrently, adding them to course list in the order of subjects"""
+        for subject, subject_course_list in zip(subjects, self.map_concurrently(self.get_course_list, subjects)):
+            if subject_course_list is not None:
+                self.course_list[subject["code"]] = subject_course_list
+                self.unfetched_courses[subject["code"]] = {"hash": None, "courses": self.get_unfetched_courses(subject_course_list)}
+
+    def get_unfetched_courses(self, subject_course_list: list) -> list:
+        """Get keys (crse_id-crse_offer_nbr) of the courses of a course list without fetched data, in course list order"""
+        return merge_unique([
+            f"{course_info['crse_id']}-{course_info['crse_offer_nbr']}"
+            for course_info in subject_course_list
+            if f"{course_info['crse_id']}-{course_info['crse_offer_nbr']}" not in self.checkpoint
+        ])
+
+    def get_course_list(self, subject: dict) -> list | None:
+        """Get list of courses in the given subject, or None if it cannot be fetched (to be retried on the next run)"""
         subject_code = subject["code"]
         subject_desc = subject["desc"]
         print(f"Getting {subject_code} course list")
 
         url = f"{BASE_URL}/courses/subject/{subject_code} - {subject_desc}?access_token={API_KEY}"
-        response = requests.get(url)
+        try:
+            response = self.get(url)
+        except requests.RequestException as e:
+            print(f" - Exception raised while getting {subject_code} course list: {e}, skipping")
+            return None
         if response.status_code != 200:
-            print(f" - Response status code: {response.status_code}, skipping")
-            self.course_list[subject_code] = []
-            return
+            print(f" - {subject_code} response status code: {response.status_code}, skipping")
+            return None
         data = response.json()
 
         course_summaries = data["ssr_get_courses_resp"]["course_search_result"]["subjects"]["subject"]["course_summaries"]
         if course_summaries is not None:
             course_summary = course_summaries["course_summary"]
             if type(course_summary) == dict:  # There is only 1 course in list
-                self.course_list[subject_code] = [course_summary]
+                return [course_summary]
             elif type(course_summary) == list:  # There are multiple courses in list
-                self.course_list[subject_code] = course_summary
+                return course_summary
         else:
-            print(" - No course list available")
-            self.course_list[subject_code] = []
+            print(f" - No {subject_code} course list available")
+            return []
+
+    def fetch_course_offering(self, course_info: dict) -> tuple:
+        """Fetch the Curriculum API course offering of a course given the course info taken from course list
+
+        Returns:
+            Arguments of parse_course_offering, which extracts the course's detailed data in the pipeline's parse stage
 
-    def get_course_data(self, course_info: dict):
-        """Get the detailed data of a course given the course info taken from course list"""
+        Raises:
+            requests.HTTPError: If the Curriculum API still throttles or fails after retries, so that the course is not
+                given fallback data from course list but retried on the next run
+        """
         crse_id = course_info["crse_id"]
         crse_offer_nbr = course_info["crse_offer_nbr"]
         print(f"Getting data for course (crse_id: {crse_id}, crse_offer_nbr: {crse_offer_nbr})")
 
-        # Use data from course list as fallback if course data is not available
-        crse_data = {
-            "title": course_info["course_title_long"],
-            "number": f"{course_info['subject'].strip()} {course_info['catalog_nbr'].strip()}",
-            "crse_id": course_info["crse_id"],
-            "crse_offer_nbr": course_info["crse_offer_nbr"],
-            "codes": [],
-            "description": None,
-            "prerequisites": None,
-            "typically_offered": course_info["ssr_crse_typoff_cd_lov_descr"],
-            "cross_listed_as": []
-        }
-
         url = f"{BASE_URL}/courses/crse_id/{crse_id}/crse_offer_nbr/{crse_offer_nbr}?access_token={API_KEY}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f" - Response status code: {response.status_code}, using data from course list")
-        else:
-            data = response.json()
-            data = data["ssr_get_course_offering_resp"]["course_offering_result"]
-            if "course_offering" in data:
-                data = data["course_offering"]
-
-                crse_data["title"] = data["course_title_long"]
-                crse_data["number"] = f"{data['subject'].strip()} {data['catalog_nbr'].strip()}"
-                crse_data["codes"] = []
-                crse_data["description"] = data["descrlong"]
-                crse_data["prerequisites"] = data["rqrmnt_group_descr"]
-                crse_data["typically_offered"] = data["ssr_crse_typoff_cd_lov_descr"]
-                crse_data["cross_listed_as"] = []
-                crse_data["crse_id"] = data["crse_id"]
-                crse_data["crse_offer_nbr"] = data["crse_offer_nbr"]
-
-                # Determine curriculum codes
-                course_attributes_data = data["course_attributes"]
-                if course_attributes_data is None:  # There are no course attributes
-                    pass
-                elif type(course_attributes_data["course_attribute"]) == dict:  # There is only 1 course attribute
-                    course_attribute = course_attributes_data["course_attribute"]
-                    if course_attribute["crse_attr_value"] in valid_curriculum_codes:
-                        crse_data["codes"].append(course_attribute["crse_attr_value"])
-                elif type(course_attributes_data["course_attribute"]) == list:  # There are multiple course attributes
-                    for course_attribute in course_attributes_data["course_attribute"]:
-                        if course_attribute["crse_attr_value"] in valid_curriculum_codes:
-                            crse_data["codes"].append(course_attribute["crse_attr_value"])
-            else:
-                print(f" - No course data available, using data from course list")
-
-        subject = course_info["subject"]
-        if subject not in self.course_data:
-            self.course_data[subject] = []
-        self.course_data[subject].append(crse_data)
+        response = self.get(url)
+        if response.status_code in RETRY_STATUS_CODES:
+            raise requests.HTTPError(f"Response status code {response.status_code}", response=response)
+        return course_info, response.status_code, response.content, valid_curriculum_codes
 
     def get_batch_of_course_data(self, batch_size=10):
-        """Get data of a batch of courses and maintain record of the courses already with fetched data"""
-        scrape_count = 0
-        for subject_course_list in self.course_list.values():
-            for course_info in subject_course_list:
-                crse_id = course_info["crse_id"]
-                crse_offer_nbr = course_info["crse_offer_nbr"]
-                if f"{crse_id}-{crse_offer_nbr}" not in self.courses_with_data:
-                    print(f"{scrape_count + 1}: ", end="")
-                    self.get_course_data(course_info)
-                    self.courses_with_data.append(f"{crse_id}-{crse_offer_nbr}")
-                    scrape_count += 1
-                    if scrape_count >= batch_size:
-                        return
+        """Get data of a batch of courses and maintain record of the courses already with fetched data
+
+        Course offerings are fetched concurrently, parsed in worker processes, and added to course data in course list
+        order, so that the resulting course data is the same as in a serial run
+        A course whose data cannot be fetched is skipped, to be retried on the next run
+        """
+        batch = []
+        batch_courses = set()  # A course listed twice is fetched once, as in a serial run
+        # Only the course lists of subjects with unfetched courses are read, pruning courses fetched since (e.g. under
+        # another subject listing them too)
+        for subject, unfetched_courses in self.unfetched_courses.items():
+            unfetched_courses["courses"] = [course_key for course_key in unfetched_courses["courses"] if course_key not in self.checkpoint]
+            course_keys = set(unfetched_courses["courses"]) - batch_courses
+            if not course_keys:
+                continue
+            for course_info in self.course_list[subject]:
+                course_key = f"{course_info['crse_id']}-{course_info['crse_offer_nbr']}"
+                if course_key in course_keys and course_key not in batch_courses:
+                    batch.append(course_info)
+                    batch_courses.add(course_key)
+                    if len(batch) >= batch_size:
+                        break
+            if len(batch) >= batch_size:
+                break
+
+        pipeline = Pipeline(PARSE_WORKERS, PIPELINE_MAX_PENDING)
+        fetch_course_offering = pipeline.timed_fetch(self.fetch_course_offering)
+
+        def fetch(course_info: dict) -> tuple:
+            try:
+                return course_info, fetch_course_offering(course_info), None
+            except Exception as e:
+                return course_info, None, e
+
+        skip_count = 0
+        fetched = self.map_concurrently(fetch, batch, PIPELINE_MAX_PENDING)
+        for scrape_count, (course_info, crse_data, exception) in enumerate(pipeline.run(fetched, parse_course_offering)):
+            course_key = f"{course_info['crse_id']}-{course_info['crse_offer_nbr']}"
+            if exception is not None:
+                print(f"Exception raised while getting data for course {course_key}: {exception}, skipping")
+                skip_count += 1
+                continue
+            self.checkpoint.append(course_key, {"subject": course_info["subject"], "course_data": crse_data})
+            self.add_course_data(course_key, course_info["subject"], crse_data)
+            print(f"{scrape_count + 1}: Got data for {crse_data['number']}")
+            if (scrape_count + 1) % CHECKPOINT_COMPACT_EVERY == 0:
+                self.save()
+        print(pipeline.get_stats_summary())
+
+        # Once every listed course has been fetched at the end of a refresh, drop courses no longer listed
+        if self.remove_unlisted_courses and len(batch) < batch_size and not skip_count:
+            self.remove_unlisted_course_data()
+            self.remove_unlisted_courses = False
+
+    def add_course_data(self, course_key: str, subject: str, crse_data: dict):
+        """Add the fetched data of a course (identified by crse_id and crse_offer_nbr) to course data
+
+        Data fetched for the course before (e.g. before a refresh) is replaced in place
+        """
+        if subject not in self.course_data:
+            self.course_data[subject] = []
+        subject_courses = self.course_data[subject]
+        for i, course in enumerate(subject_courses):
+            if f"{course['crse_id']}-{course['crse_offer_nbr']}" == course_key:
+                subject_courses[i] = crse_data
+                break
+        else:
+            subject_courses.append(crse_data)
+        self.courses_with_data.append(course_key)
+
+        if self.unlinked_subjects is not None and subject not in self.unlinked_subjects:
+            self.unlinked_subjects.append(subject)
+        crse_id_subjects = self.crse_id_subjects.setdefault(crse_data["crse_id"], [])
+        if subject not in crse_id_subjects:
+            crse_id_subjects.append(subject)
+
+    def remove_unlisted_course_data(self):
+        """Remove data of courses that are no longer in any course list"""
+        listed_courses = {
+            f"{course_info['crse_id']}-{course_info['crse_offer_nbr']}"
+            for subject_course_list in self.course_list.values()
+            for course_info in subject_course_list
+        }
+        for subject in list(self.course_data):
+            subject_courses = [course for course in self.course_data[subject] if f"{course['crse_id']}-{course['crse_offer_nbr']}" in listed_courses]
+            if not subject_courses:
+                del self.course_data[subject]
+            elif len(subject_courses) < len(self.course_data[subject]):
+                self.course_data[subject] = subject_courses
 
     def link_cross_listed_courses(self):
         """Link cross-listed-as courses
 
         Each course listing returned by the Curriculum API has crse_id and crse_offer_nbr fields
         Course listings with the same crse_id but different crse_offer_nbr values are the same course cross-listed with different numbers
-        When a course is found with a crse_offer_nbr value that is not 1, it implies there is at least 1 cross-listing for the course
+        Cross-listings scraped from department course catalog pages, if available, are merged in as well
+
+        Only subjects whose course data changed since the last linking, and subjects with courses of the same crse_id,
+        are read and linked, unless the department course catalog data changed, in which case all subjects are
         """
         print("Linking cross-listed courses")
-        all_courses = [course for subject_courses in self.course_data.values() for course in subject_courses]
-        for course in all_courses:
-            crse_id = course["crse_id"]
-            crse_offer_nbr = int(course["crse_offer_nbr"])
-            course_number = course["number"]
-            if crse_offer_nbr > 1:
-                for i in range(1, crse_offer_nbr):
-                    if f"{crse_id}-{i}" in self.crse_id_offer_nbr_and_course_number_mapping:
-                        cross_listed_course_number, index = self.crse_id_offer_nbr_and_course_number_mapping[f"{crse_id}-{i}"]
-                        subject = cross_listed_course_number.split(" ")[0]
-
-                        # Add course (of outer loop) to the cross_listed_as list of the cross-listed class (with crse_offer_nbr of i in inner loop)
-                        self.course_data[subject][index]["cross_listed_as"].append(course_number)
-                        self.course_data[subject][index]["cross_listed_as"] = list(set(self.course_data[subject][index]["cross_listed_as"]))
-
-                        # Add the cross-listed class (with crse_offer_nbr of i in inner loop) to the cross_listed_as list of course (of outer loop)
-                        course["cross_listed_as"].append(cross_listed_course_number)
-                        course["cross_listed_as"] = list(set(course["cross_listed_as"]))
-
-    def link_crse_id_and_crse_offer_nbr_with_course_number_and_index(self):
-        """Create a dictionary mapping (crse_id and crse_offer_nbr) to (course number and course's index in its subject's list of courses)"""
-        print("Linking crse_id and crse_offer_nbr with course numbers and indices")
-        for subject_courses in self.course_data.values():
-            for i, course in enumerate(subject_courses):
-                crse_id = course["crse_id"]
-                crse_offer_nbr = course["crse_offer_nbr"]
-                course_number = course["number"]
-                self.crse_id_offer_nbr_and_course_number_mapping[f"{crse_id}-{crse_offer_nbr}"] = (course_number, i)
+        html_course_data = ShardedStore(get_shards_path(HTML_COURSE_DATA_FILE_PATH))
+        if html_course_data.exists():
+            # The index holds the content hash of each shard, so it changes whenever the scraped data does
+            html_fingerprint = hashlib.sha256(json.dumps([[key, html_course_data.get_saved_hash(key)] for key in html_course_data]).encode()).hexdigest()
+        elif path.exists(HTML_COURSE_DATA_FILE_PATH):
+            html_fingerprint = f"{path.getsize(HTML_COURSE_DATA_FILE_PATH)}-{path.getmtime(HTML_COURSE_DATA_FILE_PATH)}"
+        else:
+            html_fingerprint = None
+        if html_fingerprint != self.html_fingerprint:
+            self.html_cross_listings = {}
+            if html_course_data.exists():
+                self.html_cross_listings = get_html_cross_listings(html_course_data)
+            elif path.exists(HTML_COURSE_DATA_FILE_PATH):
+                with open(HTML_COURSE_DATA_FILE_PATH, "r") as file:
+                    self.html_cross_listings = get_html_cross_listings(json.load(file))
+            self.html_fingerprint = html_fingerprint
+            self.unlinked_subjects = None
+
+        if self.unlinked_subjects is None:
+            subjects = set(self.course_data)
+            self.crse_id_subjects = {}
+            for subject in self.course_data:
+                for course in self.course_data[subject]:
+                    crse_id_subjects = self.crse_id_subjects.setdefault(course["crse_id"], [])
+                    if subject not in crse_id_subjects:
+                        crse_id_subjects.append(subject)
+        else:
+            subjects = {subject for subject in self.unlinked_subjects if subject in self.course_data}
+            crse_ids = {course["crse_id"] for subject in subjects for course in self.course_data[subject]}
+            subjects.update(subject for crse_id in crse_ids for subject in self.crse_id_subjects.get(crse_id, []) if subject in self.course_data)
+
+        # Subjects are linked in course data order, so that cross-listings are in the same order as when linking all subjects
+        link_cross_listed_courses({subject: self.course_data[subject] for subject in self.course_data if subject in subjects}, self.html_cross_listings)
+        self.unlinked_subjects = []
+        print(f"Linked cross-listed courses of {len(subjects)} of {len(self.course_data)} subjects")
 
 
 if __name__ == "__main__":
-    data_downloader = CurriculumAPIDataDownloader()
+    parser = argparse.ArgumentParser(description="Download data about Duke University courses from the Curriculum API")
+    parser.add_argument("--refresh", action="store_true", help="Refetch all data, revalidating cached responses and keeping previous data until it is refetched")
+    args = parser.parse_args()
+
+    data_downloader = CurriculumAPIDataDownloader(refresh=args.refresh)
     data_downloader.run()
     print(f"Number of courses with data: {len(data_downloader.courses_with_data)}")
     print(f"Time elapsed: {data_downloader.get_elapsed_time():.2f} seconds")
@@ -0,0 +1,70 @@
+"""curriculum_api_parsing.py
+
+Extraction of course data from Curriculum API responses, run in worker processes of the scraping pipeline
+"""
+
+import json
+
+
+def parse_course_offering(course_info: dict, status_code: int, content: bytes, valid_curriculum_codes: list) -> dict:
+    """Get the detailed data of a course from its Curriculum API course offering response
+
+    Args:
+        course_info: Course info taken from course list, whose data is used as fallback if course data is not available
+        status_code: Status code of the course offering response
+        content: Content of the course offering response
+        valid_curriculum_codes: Curriculum codes kept in course data
+
+    Returns:
+        Course data dict
+    """
+    crse_id = course_info["crse_id"]
+    crse_offer_nbr = course_info["crse_offer_nbr"]
+
+    # Use data from course list as fallback if course data is not available
+    crse_data = {
+        "title": course_info["course_title_long"],
+        "number": f"{course_info['subject'].strip()} {course_info['catalog_nbr'].strip()}",
+        "crse_id": course_info["crse_id"],
+        "crse_offer_nbr": course_info["crse_offer_nbr"],
+        "codes": [],
+        "description": None,
+        "prerequisites": None,
+        "typically_offered": course_info["ssr_crse_typoff_cd_lov_descr"],
+        "cross_listed_as": []
+    }
+
+    if status_code != 200:
+        print(f" - Course (crse_id: {crse_id}, crse_offer_nbr: {crse_offer_nbr}) response status code: {status_code}, using data from course list")
+    else:
+        data = json.loads(content)
+        data = data["ssr_get_course_offering_resp"]["course_offering_result"]
+        if "course_offering" in data:
+            data = data["course_offering"]
+
+            crse_data["title"] = data["course_title_long"]
+            crse_data["number"] = f"{data['subject'].strip()} {data['catalog_nbr'].strip()}"
+            crse_data["codes"] = []
+            crse_data["description"] = data["descrlong"]
+            crse_data["prerequisites"] = data["rqrmnt_group_descr"]
+            crse_data["typically_offered"] = data["ssr_crse_typoff_cd_lov_descr"]
+            crse_data["cross_listed_as"] = []
+            crse_data["crse_id"] = data["crse_id"]
+            crse_data["crse_offer_nbr"] = data["crse_offer_nbr"]
+
+            # Determine curriculum codes
+            course_attributes_data = data["course_attributes"]
+            if course_attributes_data is None:  # There are no course attributes
+                pass
+            elif type(course_attributes_data["course_attribute"]) == dict:  # There is only 1 course attribute
+                course_attribute = course_attributes_data["course_attribute"]
+                if course_attribute["crse_attr_value"] in valid_curriculum_codes:
+                    crse_data["codes"].append(course_attribute["crse_attr_value"])
+            elif type(course_attributes_data["course_attribute"]) == list:  # There are multiple course attributes
+                for course_attribute in course_attributes_data["course_attribute"]:
+                    if course_attribute["crse_attr_value"] in valid_curriculum_codes:
+                        crse_data["codes"].append(course_attribute["crse_attr_value"])
+        else:
+            print(f" - No data available for course (crse_id: {crse_id}, crse_offer_nbr: {crse_offer_nbr}), using data from course list")
+
+    return crse_data
@@ -3,16 +3,28 @@
 Program that downloads data about Duke University courses from Trinity College of Arts & Sciences department course catalogs (e.g. https://cs.duke.edu/course-catalog) and additional course catalogs with similar table format (listed in config.yaml)
 """
 
-import re
 from os import path, makedirs, listdir
+import sys
+import argparse
 import json
 from urllib.parse import urljoin
 import time
 
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 
+from checkpoint import CheckpointJournal, write_json_atomically
+from host_scheduler import HostScheduler
+from html_parsing import parse_course_catalog, parse_course_page
+from pipeline import Pipeline
+from http_cache import HTTPCache
+
+# The sharded cache format is shared with the database writer, which reads it
+sys.path.insert(0, path.abspath(path.join(path.dirname(__file__), "..", "..", "..", "db")))
+from sharded_store import ShardedStore  # noqa: E402
+
 with open("config.yaml") as file:
     config = yaml.load(file, Loader=yaml.FullLoader)
 
@@ -23,9 +35,38 @@ CACHE_DIR = path.abspath(path.join(
 ))
 makedirs(CACHE_DIR, exist_ok=True)
 
+# HTTP cache shared by the scrapers of the university
+HTTP_CACHE_DIR = path.join(path.dirname(CACHE_DIR), "http_cache")
+
+# Time for which cached responses are used without revalidation
+HTTP_CACHE_TTL_SEC = config.get("http_cache_ttl_sec", {}).get("department_course_catalogs", 0)
+
 valid_curriculum_codes = [code for code_list in config.get("curriculum_codes").values() for code in code_list]
 skip_first_table_departments = config.get("skip_first_table_departments")
 
+# Number of records between fsyncs of the checkpoint journals and number of course descriptions between saves of the full state (compactions)
+CHECKPOINT_FSYNC_EVERY = config.get("checkpoint_fsync_every", 100)
+CHECKPOINT_COMPACT_EVERY = config.get("checkpoint_compact_every", 1000)
+
+# Requests to a host start at least sleep_time_sec apart, with an adaptive number of them (up to max_requests_per_host)
+# in flight, while up to scraper_workers requests to different hosts run in parallel
+MAX_REQUESTS_PER_HOST = config.get("max_requests_per_host", 1)
+SCRAPER_WORKERS = config.get("scraper_workers", 16)
+
+# Time to wait for a connection and for the server to send data before a request fails (and is retried)
+REQUEST_TIMEOUT_SEC = (config.get("request_timeout_sec", {}).get("connect", 10), config.get("request_timeout_sec", {}).get("read", 60))
+
+# Adjustment of the number of requests in flight to a host and retries of throttled requests (see AdaptiveConcurrency)
+ADAPTIVE_CONCURRENCY_OPTIONS = config.get("adaptive_concurrency", {})
+
+# Number of processes parsing fetched pages (0 for one per core) and number of fetched pages waiting to be parsed
+# before fetching pauses
+PARSE_WORKERS = config.get("parse_workers", 0)
+PIPELINE_MAX_PENDING = config.get("pipeline_max_pending", 64)
+
+# Fields scraped from course pages, which are journaled for each course
+COURSE_DESCRIPTION_FIELDS = ("description", "prerequisites", "typically_offered", "cross_listed_as")
+
 
 class DepartmentCourseCatalogsScraper:
     """DepartmentCourseCatalogsScraper
@@ -33,181 +74,255 @@ class DepartmentCourseCatalogsScraper:
     Scraper class that downloads data about Duke University courses from Trinity College of Arts & Sciences department course catalogs
     """
 
-    def __init__(self):
+    def __init__(self, refresh: bool = False):
+        """
+        Args:
+            refresh: Whether to rescrape everything (through the HTTP cache, so unchanged pages are not downloaded again)
+                Previously scraped data is kept and replaced as it is rescraped, so that a refresh spanning several runs
+                never leaves courses without descriptions in the meantime
+        """
         self.init_time = time.time()
-
+        self.refresh = refresh
+        self.http_cache = HTTPCache(HTTP_CACHE_DIR, HTTP_CACHE_TTL_SEC)
+
+        # Requests share keep-alive connections and are scheduled per host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=SCRAPER_WORKERS, pool_maxsize=max(MAX_REQUESTS_PER_HOST, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.scheduler = HostScheduler(config.get("sleep_time_sec"), MAX_REQUESTS_PER_HOST, SCRAPER_WORKERS, ADAPTIVE_CONCURRENCY_OPTIONS)
+
+        # Course data is sharded by department, and shards are only read when their department is accessed
+        # (created from course_data.json, if the sharded store does not exist yet)
         self.course_catalog_urls = {}
-        self.course_data = {}
+        self.course_data = ShardedStore.open(path.join(CACHE_DIR, "course_data.shards"), path.join(CACHE_DIR, "course_data.json"))
         if "course_catalog_urls.json" in listdir(CACHE_DIR):
             with open(path.join(CACHE_DIR, "course_catalog_urls.json"), "r") as file:
                 self.course_catalog_urls = json.load(file)
-        if "course_data.json" in listdir(CACHE_DIR):
-            with open(path.join(CACHE_DIR, "course_data.json"), "r") as file:
-                self.course_data = json.load(file)
 
         self.courses_with_scraped_description = []
         if "courses_with_scraped_description.json" in listdir(CACHE_DIR):
             with open(path.join(CACHE_DIR, "courses_with_scraped_description.json"), "r") as file:
                 self.courses_with_scraped_description = json.load(file)
 
+        # Recover department course data and course descriptions scraped after the state was last saved (e.g. before a crash)
+        # from the checkpoint journals
+        self.department_checkpoint = CheckpointJournal(path.join(CACHE_DIR, "department_course_data_journal.jsonl"), self.course_data, CHECKPOINT_FSYNC_EVERY)
+        self.description_checkpoint = CheckpointJournal(path.join(CACHE_DIR, "course_descriptions_journal.jsonl"), self.courses_with_scraped_description, CHECKPOINT_FSYNC_EVERY)
+        for department_name, department_courses in self.department_checkpoint.replay():
+            self.course_data[department_name] = department_courses
+        courses_by_number = {}  # Maps each department with replayed course descriptions to its courses by number
+        for course_number, record in self.description_checkpoint.replay():
+            department_name = record["department"]
+            if department_name not in courses_by_number:
+                department_courses = self.course_data.get(department_name, [])
+                courses_by_number[department_name] = {course_data["number"]: course_data for course_data in department_courses}
+            course_data = courses_by_number[department_name].get(course_number)
+            if course_data is not None:
+                course_data.update(record["fields"])
+            self.courses_with_scraped_description.append(course_number)
+
+        if refresh:
+            # Save the recovered state, then forget which departments and courses have been scraped, keeping their data
+            self.save()
+            self.courses_with_scraped_description = []
+            self.department_checkpoint.restart()
+            self.description_checkpoint.restart()
+
     def run(self):
         """
         1. Get a list of URLs for department course catalogs
         2. From each department course catalog, scrape basic course data (course title, number, curriculum codes, URL)
         3. Visit each course URL and scrape course description
         """
-        if not self.course_catalog_urls:
+        if not self.course_catalog_urls or self.refresh:
             self.get_course_catalog_urls()
         # Add additional course catalogs not scraped from department pages
         for additional_course_catalog_name, additional_course_catalog_url in config.get("additional_course_catalog_urls").items():
             if additional_course_catalog_name not in self.course_catalog_urls:
                 self.course_catalog_urls[additional_course_catalog_name] = additional_course_catalog_url
 
-        for department_name in self.course_catalog_urls:
-            if department_name not in self.course_data:
-                self.get_course_data(department_name)
+        self.get_departments_course_data([
+            department_name for department_name in self.course_catalog_urls
+            if self.refresh or department_name not in self.course_data
+        ])
 
         try:
             self.scrape_batch_of_course_descriptions(config.get("course_descriptions_scraper_batch_size"))
         except Exception as e:
             print(f"Exception raised: {e}")
 
-        with open(path.join(CACHE_DIR, "course_catalog_urls.json"), "w") as file:
-            json.dump(self.course_catalog_urls, file, indent=2)
-        with open(path.join(CACHE_DIR, "course_data.json"), "w") as file:
-            json.dump(self.course_data, file, indent=2)
-        with open(path.join(CACHE_DIR, "courses_with_scraped_description.json"), "w") as file:
-            json.dump(self.courses_with_scraped_description, file, indent=2)
+        self.save()
+        print(self.http_cache.get_stats_summary())
+        print(self.scheduler.get_stats_summary())
+
+    def save(self):
+        """Save state, then compact the checkpoint journals, whose records the saved state now includes"""
+        write_json_atomically(path.join(CACHE_DIR, "course_catalog_urls.json"), self.course_catalog_urls)
+        self.course_data.save()
+        write_json_atomically(path.join(CACHE_DIR, "courses_with_scraped_description.json"), self.courses_with_scraped_description)
+        self.department_checkpoint.truncate()
+        self.description_checkpoint.truncate()
 
     def get_elapsed_time(self):
         return time.time() - self.init_time
 
+    def get(self, url: str) -> requests.Response:
+        """Get a response, through the HTTP cache"""
+        return self.http_cache.get(url, self.send)
+
+    def send(self, url: str, headers: dict) -> requests.Response:
+        """Send a GET request once the scheduler allows another request to the URL's host, retrying it while the host throttles or fails"""
+        return self.scheduler.request(url, lambda: self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT_SEC))
+
     def get_course_catalog_urls(self):
         """Get list of URLs to department course catalogs"""
         print("Getting URLs to department course catalogs")
 
         # Get URLs to department home pages
         department_urls = {}
-        response = requests.get(config.get("department_catalog_url"))
+        response = self.get(config.get("department_catalog_url"))
         soup = BeautifulSoup(response.content, "html.parser")
         for tr in soup.select("table tr"):
             department_url = tr.select_one("a")["href"]
             department_name = tr.select_one("th").text
             department_urls[department_name] = department_url
 
-        # Get URLs to department course catalogs
-        for department_name, department_url in department_urls.items():
-            response = requests.get(department_url)
-            soup = BeautifulSoup(response.content, "html.parser")
-            for li in soup.select("nav > ul > li"):
-                if li.select_one("div a").text == "Courses":
-                    course_catalog_path = li.select_one("div a")["href"]
-                    if course_catalog_path not in ("/course-catalog", "/courses"):
-                        course_catalog_path = "/courses"
-                    course_catalog_url = urljoin(department_url, course_catalog_path)
-                    self.course_catalog_urls[department_name] = course_catalog_url
-                    break
-            else:
-                course_catalog_url = urljoin(department_url, "/courses")
-                if requests.get(course_catalog_url).status_code == 200:
-                    self.course_catalog_urls[department_name] = course_catalog_url
-
-    def get_course_data(self, department_name: str):
+        # Get URLs to department course catalogs, visiting department home pages concurrently (in department order when done)
+        course_catalog_urls = {}
+        results = self.scheduler.map_by_host(self.get_course_catalog_url, list(department_urls.items()), lambda department: department[1])
+        for (department_name, _), course_catalog_url, exception in results:
+            if exception is not None:
+                raise exception
+            course_catalog_urls[department_name] = course_catalog_url
+        for department_name in department_urls:
+            if course_catalog_urls[department_name] is not None:
+                self.course_catalog_urls[department_name] = course_catalog_urls[department_name]
+
+    def get_course_catalog_url(self, department: tuple[str, str]) -> str | None:
+        """Get URL to the course catalog of a department given its name and home page URL, or None if there is none"""
+        department_name, department_url = department
+        response = self.get(department_url)
+        soup = BeautifulSoup(response.content, "html.parser")
+        for li in soup.select("nav > ul > li"):
+            if li.select_one("div a").text == "Courses":
+                course_catalog_path = li.select_one("div a")["href"]
+                if course_catalog_path not in ("/course-catalog", "/courses"):
+                    course_catalog_path = "/courses"
+                return urljoin(department_url, course_catalog_path)
+        course_catalog_url = urljoin(department_url, "/courses")
+        if self.get(course_catalog_url).status_code == 200:
+            return course_catalog_url
+        return None
+
+    def get_departments_course_data(self, department_names: list):
+        """Get course data of departments concurrently, adding it to course data in the order of department names
+
+        A department whose course catalog cannot be scraped is skipped, to be retried on the next run
+        """
+        departments_course_data = {}
+        results = self.scheduler.map_by_host(self.get_course_data, department_names, lambda department_name: self.course_catalog_urls[department_name])
+        for department_name, department_courses, exception in results:
+            if exception is not None:
+                print(f"Exception raised while getting {department_name} department course data: {exception}")
+                continue
+            departments_course_data[department_name] = department_courses
+        for department_name in department_names:
+            if department_name in departments_course_data:
+                department_courses = departments_course_data[department_name]
+                self.keep_course_descriptions(department_name, department_courses)
+                self.course_data[department_name] = department_courses
+                self.department_checkpoint.append(department_name, department_courses)
+
+    def keep_course_descriptions(self, department_name: str, department_courses: list):
+        """Copy course descriptions already scraped for a department to its rescraped course data
+
+        Descriptions scraped before a refresh are kept until the course pages are rescraped
+        """
+        scraped_courses = {course_data["number"]: course_data for course_data in self.course_data.get(department_name, [])}
+        for course_data in department_courses:
+            scraped_course_data = scraped_courses.get(course_data["number"])
+            if scraped_course_data is not None:
+                for field in COURSE_DESCRIPTION_FIELDS:
+                    if field in scraped_course_data:
+                        course_data.setdefault(field, scraped_course_data[field])
+
+    def get_course_data(self, department_name: str) -> list:
         """From each department course catalog, scrape course data: course number, title, curriculum codes, as well as URL to course description"""
         print(f"Getting {department_name} department course data")
 
         course_catalog_url = self.course_catalog_urls[department_name]
-        self.course_data[department_name] = []
+        response = self.get(course_catalog_url)
+        if response.status_code != 200:
+            raise requests.HTTPError(f"Response status code {response.status_code} for {course_catalog_url}", response=response)
+        return parse_course_catalog(response.content, course_catalog_url, valid_curriculum_codes, department_name in skip_first_table_departments)
 
-        response = requests.get(course_catalog_url)
-        soup = BeautifulSoup(response.content, "html.parser")
-        if department_name in skip_first_table_departments:
-            table = soup.select("table.tablesaw")[1]
-        else:
-            table = soup.select_one("table.tablesaw")
-        for tr in table.select("tbody tr"):
-            number = re.sub(" +", " ", tr.select("td")[0].text.strip())
-            title = re.sub(" +", " ", tr.select("td")[1].text.strip())
-            url = tr.select("td")[1].select_one("a")
-            if url:
-                url = url["href"]
-                url = urljoin(course_catalog_url, url)
-            codes = tr.select("td")[2].text.split(", ")
-            codes = [code.strip() for code in codes if code.strip() in valid_curriculum_codes]
-
-            self.course_data[department_name].append({
-                "title": title,
-                "number": number,
-                "codes": codes,
-                "url": url
-            })
+    def fetch_course_page(self, course_data: dict) -> tuple | None:
+        """Given basic course data (including URL, if available), fetch course page, whose course description, prerequisites, cross-listed course numbers, and typical offered terms are scraped in the pipeline's parse stage
 
-    def get_course_description(self, course_data: dict) -> dict:
-        """Given basic course data (including URL, if available), visit course page and scrape course description, prerequisites, cross-listed course numbers, and typical offered terms"""
+        Returns:
+            Arguments of parse_course_page, or None if the course has no URL
+        """
         print(f"Getting course description for {course_data['number']}")
         if course_data.get("url") is None:
-            return course_data
-
-        url = course_data["url"]
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
+            return None
 
-        section_section = soup.select_one("div#main div#content section.section")
-        div = section_section.select_one("section > div#block-tts-sub-content")
-        if div is None:
-            div = section_section.select_one("div#block-tts-labs-ctrs-content")
-        left_div, right_div = div.select("div.content > div > div")
-
-        description_divs = left_div.find_all("div", recursive=False)
-        if description_divs:
-            description = "\n".join([description_div.text for description_div in description_divs])
-        else:
-            description = None
-
-        prerequisites = None
-        prerequisites_label = left_div.find("h4", string="Prerequisites")
-        if prerequisites_label is not None:
-            prerequisites = prerequisites_label.find_next_sibling().text.strip()
-
-        typically_offered_label = right_div.find("h5", string="Typically Offered", recursive=False)
-        typically_offered = None
-        if typically_offered_label is not None:
-            typically_offered = typically_offered_label.find_next_sibling(string=True).strip()
-
-        cross_listed_as = []
-        for div in right_div.select("div.field"):
-            label = div.select_one("h5")
-            if label is not None:
-                label = label.text
-                lis = div.select("ul > li")
-                if label == "Cross-Listed As":
-                    cross_listed_as = [li.text.strip() for li in lis]
-
-        course_data["description"] = description
-        course_data["prerequisites"] = prerequisites
-        course_data["typically_offered"] = typically_offered
-        course_data["cross_listed_as"] = cross_listed_as
-
-        return course_data
+        response = self.get(course_data["url"])
+        if response.status_code != 200:
+            raise requests.HTTPError(f"Response status code {response.status_code} for {course_data['url']}", response=response)
+        return (response.content,)
 
     def scrape_batch_of_course_descriptions(self, batch_size=10):
-        """Scrape descriptions of a batch of courses and maintain record of the courses that have been scraped"""
-        scrape_count = 0
-        for department_courses in self.course_data.values():
+        """Scrape descriptions of a batch of courses and maintain record of the courses that have been scraped
+
+        Course pages are fetched concurrently across hosts, keeping the delay between requests to each host, and parsed
+        in worker processes
+        A course whose page cannot be scraped is skipped, to be retried on the next run
+        """
+        batch = {}  # Maps number of each course in batch to its department and course data
+        for department_name, department_courses in self.course_data.items():
             for course_data in department_courses:
                 course_number = course_data["number"]
-                if course_number not in self.courses_with_scraped_description:
-                    print(f"{scrape_count + 1}: ", end="")
-                    self.get_course_description(course_data)
-                    self.courses_with_scraped_description.append(course_data["number"])
-                    scrape_count += 1
-                    if scrape_count >= batch_size:
-                        return
-                    time.sleep(config.get("sleep_time_sec"))
+                if course_number not in self.description_checkpoint and course_number not in batch:
+                    batch[course_number] = (department_name, course_data)
+                    if len(batch) >= batch_size:
+                        break
+            if len(batch) >= batch_size:
+                break
+
+        scrape_count = 0
+        pipeline = Pipeline(PARSE_WORKERS, PIPELINE_MAX_PENDING)
+        course_pages = self.scheduler.map_by_host(
+            pipeline.timed_fetch(lambda course: self.fetch_course_page(course[1])),
+            list(batch.values()),
+            lambda course: course[1].get("url"),
+            PIPELINE_MAX_PENDING
+        )
+        for (department_name, course_data), course_description, exception in pipeline.run(course_pages, parse_course_page):
+            course_number = course_data["number"]
+            if exception is not None:
+                print(f"Exception raised while getting course description for {course_number}: {exception}")
+                continue
+            if course_description is not None:
+                course_data.update(course_description)
+            self.description_checkpoint.append(course_number, {
+                "department": department_name,
+                "fields": {field: course_data[field] for field in COURSE_DESCRIPTION_FIELDS if field in course_data}
+            })
+            self.courses_with_scraped_description.append(course_number)
+            scrape_count += 1
+            print(f"{scrape_count}: Got course description for {course_number}")
+            if scrape_count % CHECKPOINT_COMPACT_EVERY == 0:
+                self.save()
+        print(pipeline.get_stats_summary())
 
 
 if __name__ == "__main__":
-    scraper = DepartmentCourseCatalogsScraper()
+    parser = argparse.ArgumentParser(description="Download data about Duke University courses from department course catalogs")
+    parser.add_argument("--refresh", action="store_true", help="Rescrape all data, revalidating cached pages and keeping previous data until it is rescraped")
+    args = parser.parse_args()
+
+    scraper = DepartmentCourseCatalogsScraper(refresh=args.refresh)
     scraper.run()
     print(f"Number of courses with scraped description: {len(scraper.courses_with_scraped_description)}")
     print(f"Time elapsed: {scraper.get_elapsed_time():.2f} seconds")
@@ -0,0 +1,114 @@
+"""host_scheduler.py
+
+Per-host politeness scheduling, so that a scraper crawls different hosts in parallel while keeping its delay per host
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
+from adaptive_concurrency import AdaptiveConcurrency
+
+
+def get_host(url: str | None) -> str:
+    return urlparse(url).netloc if url else ""
+
+
+class HostScheduler:
+    """HostScheduler
+
+    Scheduler that starts consecutive requests to a host at least delay_sec apart, with an adaptive number of
+    requests in flight to each host (see AdaptiveConcurrency, up to max_requests_per_host), while requests to different
+    hosts run independently
+    """
+
+    def __init__(self, delay_sec: float, max_requests_per_host: int = 1, max_workers: int = 16, adaptive_concurrency_options: dict = None):
+        self.delay_sec = delay_sec
+        self.max_requests_per_host = max(max_requests_per_host, 1)
+        self.max_workers = max(max_workers, 1)
+        self.adaptive_concurrency_options = adaptive_concurrency_options or {}
+        self.lock = threading.Lock()
+        self.hosts = {}  # Maps each host to its adaptive concurrency limit, lock, and the earliest time of its next request
+
+    def get_host_state(self, host: str) -> dict:
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = {
+                    "concurrency": AdaptiveConcurrency(self.max_requests_per_host, **self.adaptive_concurrency_options),
+                    "lock": threading.Lock(),
+                    "next_time": time.monotonic()
+                }
+            return self.hosts[host]
+
+    def request(self, url: str, send):
+        """Send a request to a URL with send() once the URL's host allows another request, retrying it while it is throttled or fails
+
+        Returns:
+            The response returned by send
+        """
+        host_state = self.get_host_state(get_host(url))
+
+        def wait():
+            with host_state["lock"]:
+                now = time.monotonic()
+                start_time = max(host_state["next_time"], now)
+                host_state["next_time"] = start_time + self.delay_sec
+            if start_time > now:
+                time.sleep(start_time - now)
+
+        return host_state["concurrency"].request(send, wait)
+
+    def get_stats_summary(self) -> str:
+        with self.lock:
+            hosts = dict(self.hosts)
+        return "\n".join(f"Requests to {host or 'unknown host'}: {host_state['concurrency'].get_stats_summary()}" for host, host_state in hosts.items())
+
+    def map_by_host(self, function, items: list, get_url, max_pending: int = 0):
+        """Call function on each item, running items of different hosts (by get_url(item)) in parallel
+
+        Each host's items are taken in order by max_requests_per_host workers, so a slow or large host never holds up
+        workers that could serve other hosts
+        If max_pending is given, workers wait while max_pending results wait to be consumed
+
+        Yields:
+            (item, result, exception) tuples in order of completion, with exception None if the call succeeded
+        """
+        host_queues = {}
+        for item in items:
+            host_queues.setdefault(get_host(get_url(item)), deque()).append(item)
+        results = queue.Queue(maxsize=max_pending)
+        stopped = threading.Event()
+
+        def put(result: tuple):
+            while not stopped.is_set():
+                try:
+                    results.put(result, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def work(host_queue: deque):
+            while not stopped.is_set():
+                try:
+                    item = host_queue.popleft()
+                except IndexError:
+                    return
+                try:
+                    result = (item, function(item), None)
+                except Exception as e:
+                    result = (item, None, e)
+                put(result)
+
+        tasks = [host_queue for host_queue in host_queues.values() for _ in range(self.max_requests_per_host)]
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(tasks))))
+        try:
+            for host_queue in tasks:
+                executor.submit(work, host_queue)
+            for _ in range(len(items)):
+                yield results.get()
+        finally:
+            stopped.set()
+            executor.shutdown(cancel_futures=True)
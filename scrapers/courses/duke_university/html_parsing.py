@@ -0,0 +1,108 @@
+"""html_parsing.py
+
+Extraction of course data from department course catalog pages and course pages
+
+Only the parts of a page holding course data are parsed (course tables of catalog pages and the content of course
+pages), with lxml if it is installed, as it is much faster than Python's html.parser
+"""
+
+import re
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# The class is matched by pattern since, while parsing, a tag's class attribute may not be split into classes yet
+COURSE_TABLE_STRAINER = SoupStrainer("table", class_=re.compile(r"(^|\s)tablesaw(\s|$)"))
+COURSE_PAGE_CONTENT_STRAINER = SoupStrainer("div", id="content")
+
+
+def parse_course_catalog(content: bytes, course_catalog_url: str, valid_curriculum_codes: list, skip_first_table: bool = False) -> list[dict]:
+    """Scrape basic course data (course number, title, curriculum codes, and URL of course page) from a course catalog page
+
+    Args:
+        content: Content of course catalog page
+        course_catalog_url: URL of course catalog page, against which relative course page URLs are resolved
+        valid_curriculum_codes: Curriculum codes kept in course data
+        skip_first_table: Whether courses are listed in the second course table of the page instead of the first
+
+    Returns:
+        A list of course data dicts, in order of the course table
+    """
+    soup = BeautifulSoup(content, PARSER, parse_only=COURSE_TABLE_STRAINER)
+    if skip_first_table:
+        table = soup.select("table.tablesaw")[1]
+    else:
+        table = soup.select_one("table.tablesaw")
+
+    courses = []
+    for tr in table.select("tbody tr"):
+        tds = tr.select("td")
+        number = re.sub(" +", " ", tds[0].text.strip())
+        title = re.sub(" +", " ", tds[1].text.strip())
+        url = tds[1].select_one("a")
+        if url:
+            url = url["href"]
+            url = urljoin(course_catalog_url, url)
+        codes = tds[2].text.split(", ")
+        codes = [code.strip() for code in codes if code.strip() in valid_curriculum_codes]
+
+        courses.append({
+            "title": title,
+            "number": number,
+            "codes": codes,
+            "url": url
+        })
+    return courses
+
+
+def parse_course_page(content: bytes) -> dict:
+    """Scrape course description, prerequisites, typically offered terms, and cross-listed course numbers from a course page
+
+    Returns:
+        A dict with description, prerequisites, typically_offered, and cross_listed_as fields
+    """
+    soup = BeautifulSoup(content, PARSER, parse_only=COURSE_PAGE_CONTENT_STRAINER)
+
+    section_section = soup.select_one("div#content section.section")
+    div = section_section.select_one("section > div#block-tts-sub-content")
+    if div is None:
+        div = section_section.select_one("div#block-tts-labs-ctrs-content")
+    left_div, right_div = div.select("div.content > div > div")
+
+    description_divs = left_div.find_all("div", recursive=False)
+    if description_divs:
+        description = "\n".join([description_div.text for description_div in description_divs])
+    else:
+        description = None
+
+    prerequisites = None
+    prerequisites_label = left_div.find("h4", string="Prerequisites")
+    if prerequisites_label is not None:
+        prerequisites = prerequisites_label.find_next_sibling().text.strip()
+
+    typically_offered_label = right_div.find("h5", string="Typically Offered", recursive=False)
+    typically_offered = None
+    if typically_offered_label is not None:
+        typically_offered = typically_offered_label.find_next_sibling(string=True).strip()
+
+    cross_listed_as = []
+    for field_div in right_div.select("div.field"):
+        label = field_div.select_one("h5")
+        if label is not None:
+            label = label.text
+            lis = field_div.select("ul > li")
+            if label == "Cross-Listed As":
+                cross_listed_as = [li.text.strip() for li in lis]
+
+    return {
+        "description": description,
+        "prerequisites": prerequisites,
+        "typically_offered": typically_offered,
+        "cross_listed_as": cross_listed_as
+    }
@@ -0,0 +1,153 @@
+"""http_cache.py
+
+On-disk HTTP cache shared by the scrapers, revalidating cached responses with conditional requests
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters left out of cache keys, so that e.g. rotating an API key does not invalidate the cache
+IGNORED_QUERY_PARAMETERS = {"access_token"}
+
+
+def write_file_atomically(file_path: str, data: bytes):
+    """Write a file through a temporary file, so that readers (and other threads writing it) never see a partial file
+
+    Cache files are not fsynced: losing recent cache files in a machine crash only costs refetching them
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_file_path, file_path)
+
+
+def get_cache_key(url: str) -> str:
+    parts = urlsplit(url)
+    query = urlencode([(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in IGNORED_QUERY_PARAMETERS])
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+class CachedResponse:
+    """CachedResponse
+
+    Response served from the cache, with the attributes of requests.Response used by the scrapers
+    """
+
+    def __init__(self, url: str, content: bytes, headers: dict):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.headers = headers
+        self.from_cache = True
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    """HTTPCache
+
+    Cache of successful GET responses, stored under cache_dir with bodies content-addressed by SHA-256 (so identical
+    bodies are stored once) and one entry per URL holding its body hash, ETag, Last-Modified, and time of last validation
+
+    A response validated within ttl_sec is served without a request. Otherwise, a conditional request is sent
+    (If-None-Match / If-Modified-Since), and on 304 Not Modified the cached body is served, so only changed bodies
+    are downloaded
+    """
+
+    def __init__(self, cache_dir: str, ttl_sec: float):
+        self.cache_dir = cache_dir
+        self.ttl_sec = ttl_sec
+        os.makedirs(os.path.join(cache_dir, "entries"), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, "bodies"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "not_modified": 0, "misses": 0, "uncached": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+
+    def get_entry_path(self, key: str) -> str:
+        key_hash = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.cache_dir, "entries", key_hash[:2], f"{key_hash}.json")
+
+    def get_body_path(self, body_hash: str) -> str:
+        return os.path.join(self.cache_dir, "bodies", body_hash[:2], body_hash)
+
+    def load(self, key: str) -> tuple[dict, bytes] | None:
+        """Get the cache entry and body of a cache key, or None if not cached"""
+        try:
+            with open(self.get_entry_path(key), "r") as file:
+                entry = json.load(file)
+            with open(self.get_body_path(entry["body_hash"]), "rb") as file:
+                return entry, file.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, key: str, entry: dict, body: bytes | None = None):
+        if body is not None and not os.path.exists(self.get_body_path(entry["body_hash"])):
+            write_file_atomically(self.get_body_path(entry["body_hash"]), body)
+        write_file_atomically(self.get_entry_path(key), json.dumps(entry).encode())
+
+    def count(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def get(self, url: str, send):
+        """Get a response to a GET request for url, from the cache if possible
+
+        Args:
+            url: URL requested
+            send: Function sending the GET request given the URL and a dict of extra headers, returning a requests.Response
+
+        Returns:
+            A CachedResponse if the cached response was fresh or not modified, otherwise the response received
+        """
+        key = get_cache_key(url)
+        cached = self.load(key)
+        if cached is not None:
+            entry, body = cached
+            if time.time() - entry["validated_at"] < self.ttl_sec:
+                self.count(hits=1, bytes_saved=len(body))
+                return CachedResponse(url, body, entry["headers"])
+
+        headers = {}
+        if cached is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = send(url, headers)
+
+        if response.status_code == 304 and cached is not None:
+            entry["validated_at"] = time.time()
+            self.store(key, entry)
+            self.count(not_modified=1, bytes_saved=len(body))
+            return CachedResponse(url, body, entry["headers"])
+
+        self.count(bytes_downloaded=len(response.content))
+        if response.status_code != 200:
+            self.count(uncached=1)
+            return response
+        self.count(misses=1)
+        self.store(key, {
+            "url": key,
+            "body_hash": hashlib.sha256(response.content).hexdigest(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "headers": {name: response.headers[name] for name in ("Content-Type",) if name in response.headers},
+            "validated_at": time.time()
+        }, response.content)
+        return response
+
+    def get_stats_summary(self) -> str:
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"HTTP cache: {stats['hits']} fresh hits, {stats['not_modified']} not modified (304), {stats['misses']} downloaded, "
+                f"{stats['uncached']} uncached errors, {stats['bytes_downloaded'] / 1e6:.1f} MB downloaded, {stats['bytes_saved'] / 1e6:.1f} MB saved")
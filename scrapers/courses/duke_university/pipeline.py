@@ -0,0 +1,122 @@
+"""pipeline.py
+
+Staged scraping pipeline: I/O-bound fetching in threads, CPU-bound extraction in a process pool, and a single writer
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import time
+
+
+def call_timed(function, args: tuple) -> tuple:
+    """Call function with args (in a worker process), returning its result and the time it took"""
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def get_process_context():
+    """Get the multiprocessing context that starts parse worker processes without forking the calling process"""
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(start_method)
+
+
+class StageStats:
+    """Number of items that went through a pipeline stage and the total time spent on them (summed over workers)"""
+
+    def __init__(self):
+        self.count = 0
+        self.busy_sec = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, busy_sec: float, count: int = 1):
+        with self.lock:
+            self.count += count
+            self.busy_sec += busy_sec
+
+
+class Pipeline:
+    """Pipeline
+
+    Pipeline that takes fetched items from fetcher threads (which block once max_pending fetched items wait to be
+    parsed, so memory stays bounded), parses them in a pool of parse_workers processes (all cores by default), and
+    hands parsed items to a single writer (the caller iterating over run) in fetch order
+    Worker processes are started with forkserver (or spawn where it is unavailable) rather than fork, since forking
+    while fetcher threads run can copy a lock (e.g. stdout's) held by a thread, deadlocking the worker when it takes it
+    """
+
+    def __init__(self, parse_workers: int = 0, max_pending: int = 64):
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.max_pending = max(max_pending, 1)
+        self.stats = {"fetch": StageStats(), "parse": StageStats(), "write": StageStats()}
+        self.start_time = time.perf_counter()
+
+    def timed_fetch(self, fetch):
+        """Wrap a fetch function (run in fetcher threads) to record its time in the fetch stage"""
+        def timed(*args):
+            start_time = time.perf_counter()
+            try:
+                return fetch(*args)
+            finally:
+                self.stats["fetch"].add(time.perf_counter() - start_time)
+        return timed
+
+    def run(self, fetched, parse):
+        """Parse fetched items in worker processes, yielding them to the writer
+
+        Args:
+            fetched: Iterable of (item, parse arguments, exception) tuples from the fetch stage, with parse arguments
+                None if the item has nothing to parse
+            parse: Module-level (picklable) function extracting data from the parse arguments
+
+        Yields:
+            (item, parsed data, exception) tuples in the order of fetched, with parsed data None if there was nothing
+            to parse, and exception the exception raised while fetching or parsing the item, if any
+        """
+        executor = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=get_process_context())
+        pending = deque()
+        fetched = iter(fetched)
+        try:
+            while True:
+                try:
+                    item, args, exception = next(fetched)
+                except StopIteration:
+                    break
+                except BaseException:
+                    # Hand items already fetched to the writer before the fetch stage's exception (e.g. KeyboardInterrupt)
+                    while pending:
+                        yield from self.write(*pending.popleft())
+                    raise
+                future = None
+                if exception is None and args is not None:
+                    future = executor.submit(call_timed, parse, args)
+                pending.append((item, future, exception))
+                while len(pending) > self.max_pending or (pending and (pending[0][1] is None or pending[0][1].done())):
+                    yield from self.write(*pending.popleft())
+            while pending:
+                yield from self.write(*pending.popleft())
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def write(self, item, future, exception):
+        parsed = None
+        if future is not None:
+            try:
+                parsed, parse_sec = future.result()
+                self.stats["parse"].add(parse_sec)
+            except Exception as e:
+                exception = e
+        start_time = time.perf_counter()
+        yield item, parsed, exception
+        self.stats["write"].add(time.perf_counter() - start_time)
+
+    def get_stats_summary(self) -> str:
+        """Summarize the number of items, throughput, and time spent (summed over workers) of each stage"""
+        elapsed_sec = time.perf_counter() - self.start_time
+        return "Pipeline: " + ", ".join(
+            f"{name} {stats.count} items ({stats.count / max(elapsed_sec, 1e-9):.1f}/s, {stats.busy_sec:.1f} s busy)"
+            for name, stats in self.stats.items()
+        ) + f" in {elapsed_sec:.1f} s with {self.parse_workers} parse processes"
@@ -0,0 +1,30 @@
+"""rate_limiter.py
+
+Thread-safe rate limiter shared by the threads of a scraper, so that concurrent requests respect a server's quota
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """RateLimiter
+
+    Rate limiter that spaces requests evenly at a given rate across all threads, allowing bursts of up to burst requests
+    after idle periods
+    """
+
+    def __init__(self, requests_per_sec: float, burst: int = 1):
+        self.interval = 1 / requests_per_sec if requests_per_sec else 0.0
+        self.burst = max(burst, 1)
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        with self.lock:
+            now = time.monotonic()
+            start_time = max(self.next_time, now - (self.burst - 1) * self.interval)
+            self.next_time = start_time + self.interval
+        if start_time > now:
+            time.sleep(start_time - now)